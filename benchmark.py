@@ -0,0 +1,280 @@
+from mido import MidiFile, MidiTrack, MetaMessage, Message
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import statistics
+
+import msTOgh2
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Benchmark do msTOgh2
+# --------------------------------------------
+# Gera exports RB2 sintéticos do Moonscraper e mede cada etapa da conversão.
+# Uso: python benchmark.py --output bench.json [--baseline bench_base.json]
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Gerador de charts sintéticos
+# --------------------------------------------
+
+PARTS = ["PART GUITAR", "PART BASS", "PART GUITAR COOP", "PART RHYTHM"]
+
+# gemas por dificuldade (easy, medium, hard, expert), como no instrument_notes
+GEMS = [[60, 61, 62, 63, 64], [72, 73, 74, 75, 76], [84, 85, 86, 87, 88], [96, 97, 98, 99, 100]]
+
+# notas do PART GUITAR GHL que viram fretmap / Face-Off no fretmapping_notes
+GHL_NOTES = [98, 99, 100, 95, 96, 97, 86, 87, 88, 83, 84, 85, 74, 75, 76, 71, 72, 73, 62, 63]
+FACE_OFF_NOTES = [60, 61]
+
+LOCAL_EVENTS = ["[play]", "[idle]", "[sync_wag]", "[sync_head_bang]", "[map HandMap_Default]",
+                "[map StrumMap_Default]", "[half_tempo]", "[double_tempo]"]
+GLOBAL_EVENTS = ["[verse]", "[chorus]", "[solo]", "[lighting (flare)]", "[lighting (strobe)]",
+                 "[band_jump]", "[crowd_lighters_fast]", "[crowd_normal_tempo]"]
+
+def _to_track(track_name, events):
+    # [(tick absoluto, ordem, mensagem)] -> MidiTrack com tempos delta
+    track = MidiTrack([MetaMessage("track_name", name=track_name)])
+    prev = 0
+    for tick, order, msg in sorted(events, key=lambda e: (e[0], e[1])):
+        track.append(msg.copy(time=tick - prev))
+        prev = tick
+    track.append(MetaMessage("end_of_track", time=0))
+    return track
+
+def _note(events, tick, note, length, velocity=100):
+    events.append((tick, 1, Message("note_on", note=note, velocity=velocity)))
+    events.append((tick + length, 0, Message("note_off", note=note, velocity=0)))
+
+def generate_chart(notes=2000, parts=4, ghl=True, star_power=True, local_events=40, global_events=20,
+                   ticks_per_beat=480, seed=0):
+    # export RB2 sintético: notes = gemas por dificuldade em cada PART
+    rnd = random.Random(seed)
+    step = ticks_per_beat // 4
+    length = notes * step + ticks_per_beat * 8
+    midi = MidiFile(type=1, ticks_per_beat=ticks_per_beat)
+
+    conduct = [(0, 0, MetaMessage("time_signature", numerator=4, denominator=4)),
+               (0, 0, MetaMessage("set_tempo", tempo=500000))]
+    for tick in range(ticks_per_beat * 64, length, ticks_per_beat * 64):
+        conduct.append((tick, 0, MetaMessage("set_tempo", tempo=rnd.choice([400000, 500000, 600000]))))
+    midi.tracks.append(_to_track("msTOgh2 benchmark", conduct))
+
+    last_gem = ticks_per_beat * 4 + (notes - 1) * step
+    for part in PARTS[:parts]:
+        events = []
+        for gems in GEMS:
+            tick = ticks_per_beat * 4
+            held = {} # nota -> tick em que a sustain termina (sem notas sobrepostas na mesma lane)
+            for i in range(notes):
+                sustain = rnd.choice([step // 2, step // 2, step // 2, step * 4])
+                for note in rnd.sample(gems, rnd.choice([1, 1, 1, 2])):
+                    if held.get(note, 0) > tick:
+                        continue
+                    _note(events, tick, note, sustain)
+                    held[note] = tick + sustain
+                tick += step
+        if star_power:
+            for tick in range(ticks_per_beat * 16, last_gem, ticks_per_beat * 64):
+                _note(events, tick, 116, ticks_per_beat * 8)
+        for i in range(local_events):
+            events.append((rnd.randrange(length), 0, MetaMessage("text", text=rnd.choice(LOCAL_EVENTS))))
+        # pares de solo/wail/ow_face bem formados
+        for tick in range(ticks_per_beat * 32, length, ticks_per_beat * 128):
+            for name in ("solo", "wail", "ow_face"):
+                events.append((tick, 0, MetaMessage("text", text=f"[{name}_on]")))
+                events.append((tick + ticks_per_beat * 16, 0, MetaMessage("text", text=f"[{name}_off]")))
+        midi.tracks.append(_to_track(part, events))
+
+        if ghl:
+            events = []
+            tick = ticks_per_beat * 4
+            for i in range(notes):
+                _note(events, tick, rnd.choice(GHL_NOTES), step // 2)
+                tick += step
+            for tick in range(ticks_per_beat * 8, length, ticks_per_beat * 32):
+                _note(events, tick, rnd.choice(FACE_OFF_NOTES), ticks_per_beat * 4)
+            midi.tracks.append(_to_track(part + " GHL", events))
+
+    events = []
+    for tick in range(ticks_per_beat * 4, length, ticks_per_beat):
+        _note(events, tick, rnd.choice([96, 97, 98, 100]), step // 2)
+    midi.tracks.append(_to_track("PART DRUMS", events))
+
+    events = []
+    for tick in range(ticks_per_beat * 4, length, ticks_per_beat * 8):
+        _note(events, tick, rnd.choice([96, 97, 98, 99]), step)
+    for tick in range(ticks_per_beat * 4, length, ticks_per_beat * 2):
+        _note(events, tick, 100, step)
+    midi.tracks.append(_to_track("PART KEYS", events))
+
+    events = [(0, 0, MetaMessage("text", text="[music_start]")),
+              (length, 0, MetaMessage("text", text="[end]"))]
+    for i in range(global_events):
+        events.append((rnd.randrange(length), 0, MetaMessage("text", text=rnd.choice(GLOBAL_EVENTS))))
+    midi.tracks.append(_to_track("EVENTS", events))
+    return midi
+
+def chart_bytes(midi):
+    buffer = io.BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Medição das etapas
+# --------------------------------------------
+
+def _load(data):
+    return MidiFile(file=io.BytesIO(data))
+
+def _converted(data):
+    midi = _load(data)
+    msTOgh2.convert(midi)
+    return midi
+
+def _unvalidated(data):
+    # convertido sem os avisos guardados pelo build, para medir a passada completa do validador
+    midi = _converted(data)
+    midi.validated = {}
+    return midi
+
+def _convert_file(path, output_path, options):
+    msTOgh2.convert_file(path, output_path, options)
+
+def stages(data, path, output_path):
+    # etapa -> (preparo, função medida); o preparo roda fora do tempo medido
+    python_options = msTOgh2.ConversionOptions(fast_path=False)
+    numpy_options = python_options._replace(engine="numpy")
+    fast_options = msTOgh2.ConversionOptions(fast_path=True)
+    result = {
+        "load": (lambda: data, _load),
+        "save": (lambda: _converted(data), lambda midi: midi.save(file=io.BytesIO())),
+        "copy_events_only": (lambda: _load(data),
+                             lambda midi: msTOgh2.copy_events_only(midi, "PART GUITAR", "BENCH EVENTS")),
+        "copy_notes_only": (lambda: _load(data),
+                            lambda midi: msTOgh2.copy_notes_only(midi, "PART GUITAR", "BENCH NOTES",
+                                                                 msTOgh2.instrument_notes)),
+        "merge_tracks": (lambda: _load(data),
+                         lambda midi: msTOgh2.merge_tracks(midi, "PART GUITAR", "PART GUITAR GHL", "PART KEYS",
+                                                           merged_name="BENCH MERGED")),
+        "convert_part": (lambda: _load(data),
+                         lambda midi: msTOgh2.convert_part(midi, "PART GUITAR", "PART GUITAR GHL",
+                                                           big_note_name="PART KEYS")),
+        "validate_midi_events": (lambda: _unvalidated(data), msTOgh2.validate_midi_events),
+        "normalize_midi": (lambda: _converted(data), msTOgh2.normalize_midi),
+        "convert": (lambda: _load(data), lambda midi: msTOgh2.convert(midi, python_options)),
+        "file (mido)": (lambda: None, lambda x: _convert_file(path, output_path, python_options)),
+        "file (fast path)": (lambda: None, lambda x: _convert_file(path, output_path, fast_options)),
+    }
+    if msTOgh2.np is not None:
+        result["convert (numpy)"] = (lambda: _load(data), lambda midi: msTOgh2.convert(midi, numpy_options))
+        result["file (numpy)"] = (lambda: None, lambda x: _convert_file(path, output_path, numpy_options))
+    return result
+
+def run_benchmark(data, repeat=5, only=None):
+    # mede cada etapa `repeat` vezes; guarda mínimo e mediana em segundos
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.mid")
+        with open(path, "wb") as f:
+            f.write(data)
+        output_path = os.path.join(tmp, "bench_gh2.mid")
+        for name, (setup, func) in stages(data, path, output_path).items():
+            if only and name not in only:
+                continue
+            times = []
+            for i in range(repeat):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    arg = setup()
+                    start = time.perf_counter()
+                    func(arg)
+                    times.append(time.perf_counter() - start)
+            results[name] = {"min": min(times), "median": statistics.median(times)}
+            print(f"{name:24} min {min(times) * 1000:9.2f} ms   median {statistics.median(times) * 1000:9.2f} ms")
+    return results
+
+def compare(results, baseline, tolerance):
+    # etapas com mediana pior que baseline * (1 + tolerance)
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median"):
+            continue
+        ratio = stats["median"] / base["median"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:24} {ratio:6.2f}x baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+####################################################################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark msTOgh2 on synthetic Moonscraper RB2 exports.")
+    parser.add_argument("--notes", type=int, default=2000, help="gems per difficulty in each part")
+    parser.add_argument("--parts", type=int, default=4, choices=range(1, 5), help="number of PART tracks")
+    parser.add_argument("--no-ghl", action="store_true", help="don't generate the GHL fretmap tracks")
+    parser.add_argument("--no-star-power", action="store_true", help="don't generate star power (note 116)")
+    parser.add_argument("--local-events", type=int, default=40, help="extra local text events per part")
+    parser.add_argument("--global-events", type=int, default=20, help="extra global events in EVENTS")
+    parser.add_argument("--ticks-per-beat", type=int, default=480,
+                        help="resolution of the chart (not 480 = also times the rescale to 480)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage")
+    parser.add_argument("--stage", action="append", help="only run this stage (can be repeated)")
+    parser.add_argument("--write-chart", help="also save the generated chart to this path")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous results JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    config = {"notes": args.notes, "parts": args.parts, "ghl": not args.no_ghl,
+              "star_power": not args.no_star_power, "local_events": args.local_events,
+              "global_events": args.global_events, "ticks_per_beat": args.ticks_per_beat, "seed": args.seed}
+    midi = generate_chart(notes=args.notes, parts=args.parts, ghl=config["ghl"], star_power=config["star_power"],
+                          local_events=args.local_events, global_events=args.global_events,
+                          ticks_per_beat=args.ticks_per_beat, seed=args.seed)
+    data = chart_bytes(midi)
+    if args.write_chart:
+        with open(args.write_chart, "wb") as f:
+            f.write(data)
+    messages = sum(len(track) for track in midi.tracks)
+    print(f"Synthetic chart: {len(midi.tracks)} tracks, {messages} messages, {len(data)} bytes")
+
+    results = run_benchmark(data, repeat=args.repeat, only=args.stage)
+    report = {"converter": msTOgh2.CONVERTER_VERSION,
+              "python": platform.python_version(),
+              "numpy": msTOgh2.np is not None,
+              "config": config,
+              "messages": messages,
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print(f"Results saved as: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: baseline was generated with a different chart configuration")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stage(s) slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
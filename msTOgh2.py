@@ -1,6 +1,40 @@
 from mido import MidiFile, MidiTrack, MetaMessage, Message
 import os
+import sys
 import glob
+import heapq
+import bisect
+import math
+import io
+import argparse
+import contextlib
+import copy
+import itertools
+import functools
+import concurrent.futures
+import collections
+import hashlib
+import json
+import mmap
+import tempfile
+import shutil
+import zipfile
+import time
+import threading
+import queue
+import csv
+import cProfile
+import tracemalloc
+
+try:
+    import resource # só existe fora do Windows (memória máxima do processo)
+except ImportError:
+    resource = None
+
+try:
+    import numpy as np # opcional: engine "numpy" (pip install numpy)
+except ImportError:
+    np = None
 
 ####################################################################################################################################################
 
@@ -8,18 +42,38 @@ import glob
 # CONFIGURAÇÃO DE SCRIPT
 # --------------------------------------------
 
-exit = '0' # 1 close the script automatically
-auto = '0' # 1 remove all the questions
+exit = '1' # 1 close the script automatically (0 = wait for Enter, same as --interactive)
+auto = '1' # 1 remove all the questions (0 = always ask, same as --interactive)
 click = '2' # 1 set practice drums / 2 no practice drums
 instrument = '1' # 1 guitar/bass / 2 lead/rhythm
 metal = '1' # 1 band singer / 2 band keys
 
+# Versão do conversor: muda quando a saída muda, invalida o manifest (arquivos são reconvertidos)
+CONVERTER_VERSION = "2.6"
+# Manifest do modo incremental, salvo junto das saídas (na pasta do --output-dir ou na pasta de entrada)
+MANIFEST_NAME = "msTOgh2_manifest.json"
+# Cache de tracks convertidas (uma por arquivo), para reconverter só as partes editadas; fica junto do manifest
+TRACK_CACHE_DIR = "msTOgh2_cache"
+# Tamanho máximo da pasta do cache; no fim de cada execução as entradas usadas há mais tempo são apagadas
+TRACK_CACHE_MAX_BYTES = 200 * 2**20
+# --watch: de quanto em quanto tempo a pasta é olhada e quanto tempo um arquivo tem que ficar sem mudar antes de converter
+WATCH_INTERVAL = 0.1 # segundos
+WATCH_DEBOUNCE = 0.25 # segundos
+# Batch em pipeline (--jobs 1): quantos arquivos a thread de leitura lê adiantado e quantos ficam esperando gravação
+PIPELINE_READ_AHEAD = 4
+PIPELINE_WRITE_BEHIND = 8
+# Zips de entrada que ficam abertos ao mesmo tempo (os mais antigos são fechados)
+ZIP_CACHE_SIZE = 4
+
 ####################################################################################################################################################
 
 # --------------------------------------------
 # CONFIGURAÇÃO DE MIDI
 # --------------------------------------------
 
+# Resolução do GH2: MIDIs exportados com outra resolução são reescalados para esta no fim da conversão
+GH2_TICKS_PER_BEAT = 480
+
 # Fretmapping notes
 fretmapping_notes = {
     98:40, 99:41, 100:42, 95:43, 96:44, 97:45, # expert GHL
@@ -40,6 +94,166 @@ instrument_notes = {
     116: [67, 79, 91, 103] #star power
     }
 
+# BIG-NOTE (laranja do PART KEYS) para o PART GUITAR
+big_note_notes = {100:110}
+
+# Opções da conversão (substitui as strings click/instrument/metal)
+# click: True = drums no practice / instrument: "bass" ou "rhythm" / metal: "singer" ou "keys"
+# engine: "python" ou "numpy" (mesma saída, numpy é mais rápido em charts densos; o numpy trabalha nas tracks do mido,
+# então com o numpy instalado o caminho rápido não é usado)
+# fast_path: converte direto nos bytes do arquivo quando possível (mesma saída, volta pro mido se não der)
+ConversionOptions = collections.namedtuple("ConversionOptions", ["click", "instrument", "metal", "engine", "fast_path"],
+                                           defaults=(False, "bass", "singer", "python", True))
+
+# Opções que mudam o arquivo de saída (as que entram no manifest)
+OUTPUT_OPTIONS = ("click", "instrument", "metal")
+
+def options_from_answers(click, instrument, metal):
+    # converte as respostas '1'/'2' (configuração ou prompt) para ConversionOptions
+    return ConversionOptions(click=(click == '1'),
+                             instrument="rhythm" if instrument == '2' else "bass",
+                             metal="keys" if metal == '2' else "singer")
+
+# Variantes (--variant): nome = click|noclick _ bass|rhythm _ singer|keys, ex. "noclick_bass_singer"
+VARIANT_AXES = (("click", {"click": True, "noclick": False}),
+                ("instrument", {"bass": "bass", "rhythm": "rhythm"}),
+                ("metal", {"singer": "singer", "keys": "keys"}))
+ALL_VARIANTS = [ConversionOptions(click=click, instrument=instrument, metal=metal)
+                for click in (True, False) for instrument in ("bass", "rhythm") for metal in ("singer", "keys")]
+
+def variant_name(options):
+    return f"{'click' if options.click else 'noclick'}_{options.instrument}_{options.metal}"
+
+def parse_variants(names):
+    # nomes de variante (ou "all") -> [ConversionOptions] sem repetir; ValueError se algum nome não existir
+    variants = []
+    for name in names:
+        if name == "all":
+            found = ALL_VARIANTS
+        else:
+            parts = name.split("_")
+            if len(parts) != len(VARIANT_AXES) or any(part not in choices for part, (field, choices) in zip(parts, VARIANT_AXES)):
+                raise ValueError(f"unknown variant '{name}' (expected e.g. click_bass_singer, noclick_rhythm_keys or all)")
+            found = [ConversionOptions(**{field: choices[part] for part, (field, choices) in zip(parts, VARIANT_AXES)})]
+        variants.extend(variant for variant in found if variant not in variants)
+    return variants
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Métricas por etapa (tempo, mensagens lidas/escritas, memória)
+# --------------------------------------------
+
+class Metrics:
+    # métricas de um arquivo: uma entrada por etapa, na ordem em que rodaram
+    # verbose = imprime uma linha por etapa (delete/rename/copy/merge/build), como as versões antigas
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = []
+        self.open = None
+        self.path = None # "fast" ou "mido"
+        self.seconds = None
+        self.peak_memory = None # pico do tracemalloc durante o arquivo, só com --report ou --profile
+
+    def as_dict(self):
+        return {"path": self.path,
+                "seconds": self.seconds,
+                "peak_memory": self.peak_memory,
+                "stages": self.stages}
+
+_metrics = threading.local()
+
+def current_metrics():
+    return getattr(_metrics, "current", None)
+
+@contextlib.contextmanager
+def collect_metrics(verbose=False):
+    # ativa um Metrics para o código que roda dentro do with (um por thread)
+    previous = current_metrics()
+    metrics = Metrics(verbose)
+    _metrics.current = metrics
+    try:
+        yield metrics
+    finally:
+        _metrics.current = previous
+
+@contextlib.contextmanager
+def stage(name):
+    # mede uma etapa; uma etapa dentro de outra soma as contagens na de fora
+    metrics = current_metrics()
+    if metrics is None:
+        yield {"read": 0, "emitted": 0}
+        return
+    if metrics.open is not None:
+        yield metrics.open
+        return
+    record = {"stage": name, "seconds": 0.0, "read": 0, "emitted": 0}
+    metrics.open = record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        metrics.open = None
+        metrics.stages.append(record)
+
+def log_step(text):
+    # mensagem de progresso de uma etapa; só aparece com --verbose
+    metrics = current_metrics()
+    if metrics is not None and metrics.verbose:
+        print(text)
+
+def _message_count(track):
+    # mensagens da track (RawTrack: só conta se os eventos já foram lidos)
+    if track is None:
+        return 0
+    if isinstance(track, RawTrack):
+        return len(track._events) if track._events is not None else 0
+    return len(track)
+
+def _max_rss():
+    # memória máxima em bytes deste processo e dos workers do --jobs que já terminaram (None no Windows)
+    # só cresce durante a execução, então é um número por execução e não por arquivo
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss if sys.platform == "darwin" else rss * 1024
+
+@contextlib.contextmanager
+def profiled(input_path, profile_dir, metrics, measure_memory=False):
+    # --profile: grava o cProfile (.prof) e as maiores alocações do tracemalloc (.memory.txt) do arquivo
+    # measure_memory (--report): sem --profile, só guarda o pico do tracemalloc do arquivo em metrics.peak_memory
+    # (no batch em pipeline entra também o que a thread de leitura trouxe enquanto isso)
+    if profile_dir is None:
+        if not measure_memory or tracemalloc.is_tracing():
+            yield
+            return
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    base = os.path.join(profile_dir, f"{name}-{hashlib.sha1(os.path.abspath(input_path).encode()).hexdigest()[:8]}")
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        metrics.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".memory.txt", "w", encoding="utf-8") as f:
+            f.write(f"peak: {metrics.peak_memory} bytes\n")
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"{stat}\n")
+
 ####################################################################################################################################################
 
 # --------------------------------------------
@@ -49,88 +263,470 @@ instrument_notes = {
 ####################################################################################################################################################
 
 # Validador para GH2 - Naonemeu
-def validate_midi_events(midi, tracks_to_validate=None):
-# Valida e corrige eventos de texto em várias tracks.
+# Eventos locais válidos nas PARTs
+valid_events = [
+    "[play]", "[idle]", "[wail_on]", "[wail_off]", "[solo_on]", "[solo_off]",
+    "[sync_wag]", "[sync_head_bang]", "[map HandMap_Default]", "[map HandMap_Linear]",
+    "[map HandMap_NoChords]", "[map HandMap_AllChords]", "[map HandMap_DropD]",
+    "[map HandMap_DropD2]", "[map HandMap_Solo]", "[map StrumMap_Default]",
+    "[map StrumMap_punk]", "[map StrumMap_softpick]", "[map StrumMap_SlapBass]",
+    "[nobeat]", "[half_time]", "[double_time]", "[allbeat]", "[half_tempo]", "[double_tempo]",
+    "[ow_face_on]", "[ow_face_off]"
+]
+
+# Tracks validadas por padrão
+VALIDATED_TRACKS = ('PART GUITAR', 'PART BASS', 'PART GUITAR COOP', 'PART RHYTHM')
+
+# Compilado uma vez no import (quem mudar o valid_events em runtime precisa chamar reload_valid_events())
+VALID_EVENTS = frozenset(valid_events)
+# Eventos críticos: texto -> (nome, liga?) para a tabela de estado solo/wail/ow_face
+EVENT_TRANSITIONS = {f"[{name}_{state}]": (name, state == "on")
+                     for name in ("solo", "wail", "ow_face") for state in ("on", "off")}
+
+# Aviso do validador: track, tick absoluto, evento (já corrigido), gravidade ("warning" ou "critical") e o texto
+# o tick é o do MIDI checado; os avisos da conversão (convert_file etc.) vêm todos com os ticks do arquivo salvo (480)
+# seconds/position = onde fica na música, pelo TempoMap (None se o arquivo não tem ticks por beat)
+class Diagnostic(collections.namedtuple("Diagnostic", ["track", "tick", "event", "severity", "message",
+                                                       "seconds", "position"], defaults=(None, None))):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.message
+
+@functools.lru_cache(maxsize=4096)
+def _compile_event(text):
+    # texto cru -> (texto com colchetes corrigidos, válido?, transição ou None); uma vez por texto diferente
+    fixed = text.strip()
+    if not fixed.startswith('['):
+        fixed = f"[{fixed}"
+    if not fixed.endswith(']'):
+        fixed = f"{fixed}]"
+    return fixed, fixed in VALID_EVENTS, EVENT_TRANSITIONS.get(fixed)
+
+def reload_valid_events():
+    # refaz o VALID_EVENTS a partir do valid_events e esquece os textos já compilados com o conjunto antigo
+    global VALID_EVENTS
+    VALID_EVENTS = frozenset(valid_events)
+    _compile_event.cache_clear()
+
+def make_diagnostic(track_name, tick, event, severity, message, tempo_map=None):
+    # Diagnostic com a posição (tempo e compasso) no fim da mensagem quando há mapa de tempo
+    if tempo_map is None or not tempo_map.valid:
+        return Diagnostic(track_name, tick, event, severity, message)
+    position = tempo_map.position(tick)
+    return Diagnostic(track_name, tick, event, severity, f"{message} (at {position})",
+                      tempo_map.seconds(tick), position)
+
+class EventValidator:
+    # validador de uma track: chamado com cada evento de texto na ordem da track (também dentro do build_track)
+    # retorna o texto corrigido e junta os avisos em self.diagnostics
+    def __init__(self, track_name, tempo_map=None):
+        self.track_name = track_name
+        self.tempo_map = tempo_map
+        self.diagnostics = []
+        self.status = {'solo': False, 'wail': False, 'ow_face': False}
+
+    def __call__(self, tick, text):
+        fixed, valid, transition = _compile_event(text)
+        if not valid:
+            self.diagnostics.append(make_diagnostic(self.track_name, tick, fixed, "warning",
+                                                    f"[Check local events] Invalid event in {self.track_name}: {fixed}",
+                                                    self.tempo_map))
+        if transition is not None:
+            name, on = transition
+            # dois _on (ou dois _off) seguidos
+            if self.status[name] == on:
+                state, other = ("on", "off") if on else ("off", "on")
+                self.diagnostics.append(make_diagnostic(self.track_name, tick, fixed, "critical",
+                                                        f"[CRITICAL] Two '{name}_{state}' in sequence without a "
+                                                        f"'{name}_{other}' in {self.track_name}", self.tempo_map))
+            self.status[name] = on
+        return fixed
+
+def _validate_track(track, validator):
+    # roda o validador numa track já pronta (MidiTrack ou RawTrack); retorna quantas mensagens leu
+    if isinstance(track, RawTrack):
+        events = track.events
+        changed = False
+        for i, (tick, payload) in enumerate(events):
+            if payload[0] == 0xff and payload[1] == 0x01:
+                length, data_pos = _read_varlen(payload, 2)
+                text = payload[data_pos:].decode("latin1")
+                fixed = validator(tick, text)
+                if fixed != text:
+                    events[i] = (tick, _meta_bytes(0x01, fixed.encode("latin1")))
+                    changed = True
+        if changed:
+            track.modified()
+        return len(events)
+    tick = 0
+    for msg in track:
+        tick += msg.time
+        if msg.is_meta and msg.type == 'text':
+            msg.text = validator(tick, msg.text)
+    return len(track)
+
+def _mark_validated(midi, track, track_name, diagnostics):
+    # guarda os avisos de uma track validada durante o build, para o validate_midi_events não passar nela de novo
+    validated = getattr(midi, "validated", None)
+    if validated is None:
+        validated = midi.validated = {}
+    validated[id(track)] = (track, track_name, diagnostics)
+
+def validate_midi_events(midi, tracks_to_validate=None, notes=True):
+# Valida e corrige eventos de texto e checa as notas (check_notes) em várias tracks; retorna a lista de Diagnostic.
+# Tracks que o build_track já validou (validate=True) só devolvem os avisos guardados dos eventos.
+# notes=False não checa as notas (a conversão checa depois do normalize_midi, com o check_midi_notes).
     if tracks_to_validate is None:
-        tracks_to_validate = ['PART GUITAR', 'PART BASS', 'PART GUITAR COOP', 'PART RHYTHM']  # Default
-    valid_events = [
-        "[play]", "[idle]", "[wail_on]", "[wail_off]", "[solo_on]", "[solo_off]",
-        "[sync_wag]", "[sync_head_bang]", "[map HandMap_Default]", "[map HandMap_Linear]",
-        "[map HandMap_NoChords]", "[map HandMap_AllChords]", "[map HandMap_DropD]",
-        "[map HandMap_DropD2]", "[map HandMap_Solo]", "[map StrumMap_Default]",
-        "[map StrumMap_punk]", "[map StrumMap_softpick]", "[map StrumMap_SlapBass]",
-        "[nobeat]", "[half_time]", "[double_time]", "[allbeat]", "[half_tempo]", "[double_tempo]",
-        "[ow_face_on]", "[ow_face_off]"
-    ]
-    for track in midi.tracks:
-        # Verifica se a track está na lista a validar
-        track_name_msg = next((msg for msg in track if msg.type == 'track_name'), None)
-        if not track_name_msg or track_name_msg.name not in tracks_to_validate:
-            continue
-        track_name = track_name_msg.name
-        # Status de eventos críticos (solo, wail, ow_face)
-        event_status = {'solo': False, 'wail': False, 'ow_face': False}
+        tracks_to_validate = VALIDATED_TRACKS
+    with stage("validate") as record:
+        index = _get_track_index(midi)
+        candidates = {id(track) for name in tracks_to_validate for track in index.get(name, ())}
+        validated = getattr(midi, "validated", {})
+        diagnostics = []
+        for track in midi.tracks:
+            if id(track) not in candidates:
+                continue
+            done = validated.get(id(track))
+            if done is not None and done[0] is track:
+                if done[1] in tracks_to_validate:
+                    diagnostics.extend(done[2])
+                    if notes:
+                        diagnostics.extend(check_notes(track, done[1], get_tempo_map(midi)))
+                continue
+            # só o primeiro track_name conta (ele fica no começo da track)
+            if isinstance(track, RawTrack):
+                track_name = track.names[0]
+            else:
+                track_name = next(msg.name for msg in track if msg.type == 'track_name')
+            if track_name not in tracks_to_validate:
+                continue
+            validator = EventValidator(track_name, get_tempo_map(midi))
+            record["read"] += _validate_track(track, validator)
+            diagnostics.extend(validator.diagnostics)
+            if notes:
+                diagnostics.extend(check_notes(track, track_name, get_tempo_map(midi)))
+        return diagnostics
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Índice de notas e checagens de notas (crash no GH2)
+# --------------------------------------------
+
+# Gemas por dificuldade e as lanes que precisam de gema embaixo (notas já convertidas para o GH2)
+GEM_LANES = {"easy": range(60, 65), "medium": range(72, 77), "hard": range(84, 89), "expert": range(96, 101)}
+ALL_GEMS = frozenset(note for lane in GEM_LANES.values() for note in lane)
+FRETMAP_NOTES = range(40, 60)
+STAR_POWER_NOTES = {67: "easy", 79: "medium", 91: "hard", 103: "expert"}
+FACE_OFF_NOTES = {69: "easy", 70: "easy", 81: "medium", 82: "medium", 93: "hard", 94: "hard", 105: "expert", 106: "expert"}
+
+def track_notes(track):
+    # [(tick absoluto, nota, liga?)] na ordem da track (MidiTrack ou RawTrack); velocity 0 desliga
+    notes = []
+    if isinstance(track, RawTrack):
+        for tick, payload in track.events:
+            status = payload[0]
+            if 0x80 <= status <= 0x9f:
+                notes.append((tick, payload[1], status >= 0x90 and payload[2] > 0))
+        return notes
+    tick = 0
+    for msg in track:
+        tick += msg.time
+        if msg.type == "note_on" or msg.type == "note_off":
+            notes.append((tick, msg.note, msg.type == "note_on" and msg.velocity > 0))
+    return notes
+
+class NoteIndex:
+    # intervalos das notas de uma track: nota -> [(início, fim)] em ordem de início
+    # o pareamento note_on/note_off é uma passada só; as consultas de cobertura são bisect
+    def __init__(self, notes):
+        self.spans = {}
+        self.unmatched_on = [] # [(tick, nota)] sem note_off até o fim da track
+        self.unmatched_off = [] # note_off sem note_on antes
+        self.overlaps = [] # note_on com a mesma nota ainda ligada
+        self._lanes = {}
+        # nota -> [início, quantos note_on abertos]; notas sobrepostas viram um intervalo só
+        held = {}
+        for tick, note, on in notes:
+            open_note = held.get(note)
+            if on:
+                if open_note is None:
+                    held[note] = [tick, 1]
+                else:
+                    self.overlaps.append((tick, note))
+                    open_note[1] += 1
+            elif open_note is None:
+                self.unmatched_off.append((tick, note))
+            else:
+                open_note[1] -= 1
+                if open_note[1] == 0:
+                    del held[note]
+                    self.spans.setdefault(note, []).append((open_note[0], tick))
+        self.unmatched_on = sorted((start, note) for note, (start, count) in held.items())
+
+    def lane(self, notes):
+        # intervalos de um conjunto de notas juntos: (inícios em ordem, maior fim até cada posição)
+        key = frozenset(notes)
+        lane = self._lanes.get(key)
+        if lane is None:
+            spans = sorted(span for note in key for span in self.spans.get(note, ()))
+            lane = ([start for start, end in spans], list(itertools.accumulate((end for start, end in spans), max)))
+            self._lanes[key] = lane
+        return lane
+
+    def starts_within(self, notes, start, end):
+        # alguma nota começa em [start, end) (ou no próprio tick, se a nota tem duração 0)
+        starts, max_end = self.lane(notes)
+        return bisect.bisect_left(starts, start) < bisect.bisect_left(starts, max(end, start + 1))
+
+    def covers(self, notes, start, end):
+        # alguma nota começa dentro do intervalo ou ainda está soando no início dele
+        if self.starts_within(notes, start, end):
+            return True
+        starts, max_end = self.lane(notes)
+        i = bisect.bisect_left(starts, start) - 1
+        return i >= 0 and max_end[i] > start
+
+def check_notes(track, track_name, tempo_map=None):
+    # notas que derrubam ou bagunçam o GH2; retorna [Diagnostic] em ordem de tick
+    # dificuldade sem nenhuma gema (não charteada) não é checada
+    index = NoteIndex(track_notes(track))
+    found = []
+    for tick, note in index.unmatched_on:
+        found.append((tick, note, "critical", f"[CRITICAL] note_on without note_off (note {note}) in {track_name}"))
+    for tick, note in index.unmatched_off:
+        found.append((tick, note, "critical", f"[CRITICAL] note_off without note_on (note {note}) in {track_name}"))
+    for tick, note in index.overlaps:
+        found.append((tick, note, "critical", f"[CRITICAL] Overlapping note {note} in {track_name}"))
+    if index.lane(ALL_GEMS)[0]:
+        for note in FRETMAP_NOTES:
+            for start, end in index.spans.get(note, ()):
+                if not index.covers(ALL_GEMS, start, end):
+                    found.append((start, note, "warning", f"[Check notes] Fretmap note {note} with no gem under it in {track_name}"))
+    for lanes, label in ((STAR_POWER_NOTES, "Star power"), (FACE_OFF_NOTES, "Face-Off")):
+        for note, difficulty in lanes.items():
+            gems = GEM_LANES[difficulty]
+            if not index.lane(gems)[0]:
+                continue
+            for start, end in index.spans.get(note, ()):
+                if not index.starts_within(gems, start, end):
+                    found.append((start, note, "warning",
+                                  f"[Check notes] {label} (note {note}) with no {difficulty} gem in {track_name}"))
+    found.sort(key=lambda f: f[0])
+    return [make_diagnostic(track_name, tick, f"note {note}", severity, message, tempo_map)
+            for tick, note, severity, message in found]
+
+def check_midi_notes(midi, tracks_to_check=None, memo=None):
+    # check_notes nas tracks como vão ser salvas (depois do normalize_midi, que já tirou notas duplicadas e de
+    # duração zero), para os avisos baterem com o arquivo; os ticks são os do arquivo salvo (já reescalados)
+    # memo = o mesmo do normalize_midi: a track compartilhada entre as variantes é checada uma vez
+    if tracks_to_check is None:
+        tracks_to_check = VALIDATED_TRACKS
+    if memo is None:
+        memo = {}
+    with stage("check notes") as record:
+        index = _get_track_index(midi)
+        names = {id(track): name for name in tracks_to_check for track in index.get(name, ())}
+        diagnostics = []
+        for track in midi.tracks:
+            track_name = names.get(id(track))
+            if track_name is None:
+                continue
+            found = memo.get(("notes", id(track)))
+            if found is None or found[0] is not track:
+                found = (track, check_notes(track, track_name, get_tempo_map(midi)))
+                memo[("notes", id(track))] = found
+                record["read"] += _message_count(track)
+            diagnostics.extend(found[1])
+        return diagnostics
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Mapa de tempo (tick -> segundos e tick -> compasso/tempo)
+# --------------------------------------------
+
+class TempoMap:
+    # listas das mudanças de tempo e de compasso em ordem de tick; cada consulta é um bisect
+    # tempos = [(tick, microssegundos por beat)], signatures = [(tick, numerador, denominador)]
+    def __init__(self, ticks_per_beat, tempos=(), signatures=()):
+        self.ticks_per_beat = ticks_per_beat
+        self.valid = ticks_per_beat > 0 # divisão SMPTE não tem ticks por beat
+        # segundos acumulados no início de cada trecho de tempo (120 BPM até o primeiro set_tempo)
+        # sem ticks por beat não há segundos (nem posições nos avisos), então as mudanças de tempo são ignoradas
+        self.tempo_ticks = [0]
+        self.tempo_values = [500000]
+        self.tempo_seconds = [0.0]
+        for tick, tempo in tempos if self.valid else ():
+            if tick == self.tempo_ticks[-1]:
+                self.tempo_values[-1] = tempo
+                continue
+            self.tempo_seconds.append(self._seconds(len(self.tempo_ticks) - 1, tick))
+            self.tempo_ticks.append(tick)
+            self.tempo_values.append(tempo)
+        # compasso (contado de 0) em que cada fórmula começa; 4/4 até o primeiro time_signature
+        self.signature_ticks = [0]
+        self.signature_bars = [0]
+        self.beat_ticks = [ticks_per_beat]
+        self.bar_ticks = [ticks_per_beat * 4]
+        for tick, numerator, denominator in signatures:
+            beat = ticks_per_beat * 4 / denominator
+            if tick != self.signature_ticks[-1]:
+                # mudança no meio de um compasso abre um compasso novo
+                bars = math.ceil((tick - self.signature_ticks[-1]) / self.bar_ticks[-1]) if self.valid else 0
+                self.signature_ticks.append(tick)
+                self.signature_bars.append(self.signature_bars[-1] + bars)
+                self.beat_ticks.append(beat)
+                self.bar_ticks.append(beat * numerator)
+            else:
+                self.beat_ticks[-1] = beat
+                self.bar_ticks[-1] = beat * numerator
+
+    def _seconds(self, i, tick):
+        return self.tempo_seconds[i] + (tick - self.tempo_ticks[i]) * self.tempo_values[i] / (1e6 * self.ticks_per_beat)
+
+    def seconds(self, tick):
+        # tick absoluto -> segundos desde o início
+        return self._seconds(bisect.bisect_right(self.tempo_ticks, tick) - 1, tick)
+
+    def bar_beat(self, tick):
+        # tick absoluto -> (compasso, tempo), os dois contados de 1 como no Moonscraper/REAPER
+        i = bisect.bisect_right(self.signature_ticks, tick) - 1
+        offset = tick - self.signature_ticks[i]
+        bars, rest = divmod(offset, self.bar_ticks[i])
+        return self.signature_bars[i] + int(bars) + 1, rest / self.beat_ticks[i] + 1
+
+    def position(self, tick):
+        # texto para os avisos: "1:23.456, bar 12 beat 3"
+        minutes, seconds = divmod(self.seconds(tick), 60)
+        bar, beat = self.bar_beat(tick)
+        return f"{int(minutes)}:{seconds:06.3f}, bar {bar} beat {round(beat, 2):g}"
+
+def build_tempo_map(midi):
+    # lê os set_tempo/time_signature da primeira track (conduct) uma vez por arquivo; fica em midi.tempo_map
+    tempos = []
+    signatures = []
+    track = midi.tracks[0] if midi.tracks else []
+    if isinstance(track, RawTrack):
+        for tick, payload in track.events:
+            if payload[0] == 0xff and payload[1] in (0x51, 0x58):
+                length, data_pos = _read_varlen(payload, 2)
+                data = payload[data_pos:]
+                if payload[1] == 0x51:
+                    tempos.append((tick, int.from_bytes(data, "big")))
+                else:
+                    signatures.append((tick, data[0], 2 ** data[1]))
+    else:
+        tick = 0
         for msg in track:
-            if msg.is_meta and msg.type == 'text':
-                text = msg.text.strip()
-                # Corrigir formatação de colchetes
-                if not text.startswith('['):
-                    text = f"[{text}"
-                if not text.endswith(']'):
-                    text = f"{text}]"
-                msg.text = text
-                # Checar se é um evento válido
-                if text not in valid_events:
-                    print(f"[Check local events] Invalid event in {track_name}: {text}")
-                # Checar status de eventos críticos
-                if text in ['[solo_on]', '[solo_off]', '[wail_on]', '[wail_off]', '[ow_face_on]', '[ow_face_off]']:
-                    event_name = text.rsplit('_', 1)[0][1:]  # solo, wail, ow_face
-                    event_type = text.split('_')[-1][:-1]   # on/off
-                    if event_type == 'on':
-                        if event_status[event_name]:
-                            print(f"[CRITICAL] Two '{event_name}_on' in sequence without a '{event_name}_off' in {track_name}")
-                        event_status[event_name] = True
-                    elif event_type == 'off':
-                        if not event_status[event_name]:
-                            print(f"[CRITICAL] Two '{event_name}_off' in sequence without a '{event_name}_on' in {track_name}")
-                        event_status[event_name] = False
+            tick += msg.time
+            if msg.type == "set_tempo":
+                tempos.append((tick, msg.tempo))
+            elif msg.type == "time_signature":
+                signatures.append((tick, msg.numerator, msg.denominator))
+    midi.tempo_map = TempoMap(midi.ticks_per_beat, tempos, signatures)
+    return midi.tempo_map
+
+def get_tempo_map(midi):
+    tempo_map = getattr(midi, "tempo_map", None)
+    if tempo_map is None:
+        tempo_map = build_tempo_map(midi)
+    return tempo_map
+
+####################################################################################################################################################
+
+def build_track_index(midi):
+# Monta o índice nome -> tracks uma vez por MidiFile (mesma ordem de midi.tracks).
+    index = {}
+    for track in midi.tracks:
+        for name in _track_names(track):
+            index.setdefault(name, []).append(track)
+    midi.track_index = index
+    return index
+
+def _track_names(track):
+    # nomes únicos de track_name dentro da track, na ordem em que aparecem
+    if isinstance(track, RawTrack):
+        return list(track.names)
+    names = []
+    for msg in track:
+        if msg.type == "track_name" and msg.name not in names:
+            names.append(msg.name)
+    return names
+
+def _get_track_index(midi):
+    index = getattr(midi, "track_index", None)
+    if index is None:
+        index = build_track_index(midi)
+    return index
+
+def _index_add(midi, track, name):
+    # insere a track na lista do nome respeitando a ordem de midi.tracks
+    tracks = _get_track_index(midi).setdefault(name, [])
+    if any(t is track for t in tracks):
+        return
+    tracks.append(track)
+    if len(tracks) > 1:
+        position = {id(t): i for i, t in enumerate(midi.tracks)}
+        tracks.sort(key=lambda t: position.get(id(t), len(position)))
+
+def _index_remove(midi, track, name=None):
+    # tira a track do índice (de um nome só ou de todos se name for None)
+    index = _get_track_index(midi)
+    names = [name] if name is not None else list(index)
+    for n in names:
+        tracks = [t for t in index.get(n, []) if t is not track]
+        if tracks:
+            index[n] = tracks
+        else:
+            index.pop(n, None)
 
 ####################################################################################################################################################
 
 def get_track_by_name(midi, track_name):
 # Retorna a primeira track com o nome especificado.
-    for track in midi.tracks:
-        for msg in track:
-            if msg.type == "track_name" and msg.name == track_name:
-                return track
+    tracks = _get_track_index(midi).get(track_name)
+    if tracks:
+        return tracks[0]
     return None
 
 ####################################################################################################################################################
 
 def delete_track(midi, track_name):
 # Deleta a primeira track usando o nome especificado.
-    for i, track in enumerate(midi.tracks):
-        for msg in track:
-            if msg.type == "track_name" and msg.name == track_name:
-                del midi.tracks[i]
-                print(f"'{track_name}' deleted")
-                return True
-    print(f"'{track_name}' not found")
-    return False
+    with stage(f"delete {track_name}"):
+        track = get_track_by_name(midi, track_name)
+        if track is not None:
+            for i, t in enumerate(midi.tracks):
+                if t is track:
+                    del midi.tracks[i]
+                    break
+            _index_remove(midi, track)
+            log_step(f"'{track_name}' deleted")
+            return True
+        log_step(f"'{track_name}' not found")
+        return False
 
 ####################################################################################################################################################
 
 def rename_track_by_name(midi, old_name, new_name):
 # Renomeia a track que tem o nome old_name para new_name.
-    track = get_track_by_name(midi, old_name)
-    if track:
-        for msg in track:
-            if msg.type == "track_name" and msg.name == old_name:
-                msg.name = new_name
-        print(f"'{old_name}' renamed to '{new_name}'")
-        return True
-    print(f"'{old_name}' not found")
-    return False
+    with stage(f"rename {old_name}"):
+        track = get_track_by_name(midi, old_name)
+        if track:
+            if isinstance(track, RawTrack):
+                _rename_raw_track(track, old_name, new_name)
+            else:
+                for msg in track:
+                    if msg.type == "track_name" and msg.name == old_name:
+                        msg.name = new_name
+            _index_remove(midi, track, old_name)
+            _index_add(midi, track, new_name)
+            log_step(f"'{old_name}' renamed to '{new_name}'")
+            return True
+        log_step(f"'{old_name}' not found")
+        return False
 
 ####################################################################################################################################################
 
@@ -138,81 +734,1200 @@ def ensure_track(midi, track_name):
     # garante que a track exista, criando vazia se não existir
     track = get_track_by_name(midi, track_name)
     if track is None:
-        track = MidiTrack([MetaMessage("track_name", name=track_name)])
+        if isinstance(midi, RawMidi):
+            track = RawTrack([track_name], events=[_raw_track_name_event(track_name)])
+        else:
+            track = MidiTrack([MetaMessage("track_name", name=track_name)])
         midi.tracks.append(track)
+        _index_add(midi, track, track_name)
     return track
 
+def move_track_to_end(midi, track):
+    # tira a track da posição atual e põe no fim (mantendo o índice na ordem de midi.tracks)
+    for i, t in enumerate(midi.tracks):
+        if t is track:
+            del midi.tracks[i]
+            break
+    else:
+        return
+    midi.tracks.append(track)
+    for name in _track_names(track):
+        _index_remove(midi, track, name)
+        _index_add(midi, track, name)
+
+def copy_midi(midi):
+    # cópia rasa para uma variante: lista de tracks e índice próprios, as tracks são as mesmas
+    variant = copy.copy(midi)
+    variant.tracks = list(midi.tracks)
+    variant.track_index = {name: list(tracks) for name, tracks in _get_track_index(midi).items()}
+    if getattr(midi, "validated", None) is not None:
+        variant.validated = dict(midi.validated)
+    return variant
+
+def detach_track(midi, track_name):
+    # troca a track por uma cópia só desta variante (antes de um passo que escreve na track existente)
+    track = get_track_by_name(midi, track_name)
+    if track is None:
+        return None
+    if isinstance(track, RawTrack):
+        events = list(track._events) if track._events is not None else None
+        copied = RawTrack(list(track.names), track.chunk, track.canonical, events)
+    else:
+        copied = MidiTrack(track)
+    midi.tracks[next(i for i, t in enumerate(midi.tracks) if t is track)] = copied
+    for tracks in _get_track_index(midi).values():
+        for i, t in enumerate(tracks):
+            if t is track:
+                tracks[i] = copied
+    return copied
+
 ####################################################################################################################################################
 
 def copy_events_only(midi, source_name, target_name):
     # copia apenas eventos que não sejam nota, cria destino vazio se origem não existir
-    target = ensure_track(midi, target_name)
-    source = get_track_by_name(midi, source_name)
-    if source is None:
-        print(f"Track '{source_name}' not found, '{target_name}' stays empty.")
-        return target
-    cumulative_time = 0
-    for msg in source:
-        cumulative_time += msg.time
-        if msg.type not in ["track_name", "note_on", "note_off"]:
-            target.append(msg.copy(time=cumulative_time))
+    with stage(f"copy events {target_name}") as record:
+        target = ensure_track(midi, target_name)
+        source = get_track_by_name(midi, source_name)
+        if source is None:
+            log_step(f"Track '{source_name}' not found, '{target_name}' stays empty.")
+            return target
+        count = _message_count(target)
+        if isinstance(midi, RawMidi):
+            _copy_raw_events(target, source)
+        else:
             cumulative_time = 0
-    print(f"'{source_name}' events copied to '{target_name}'")
-    return target
+            for msg in source:
+                cumulative_time += msg.time
+                if msg.type not in ["track_name", "note_on", "note_off"]:
+                    target.append(msg.copy(time=cumulative_time))
+                    cumulative_time = 0
+        record["read"] += _message_count(source)
+        record["emitted"] += _message_count(target) - count
+        log_step(f"'{source_name}' events copied to '{target_name}'")
+        return target
 
 ####################################################################################################################################################
 
 def copy_notes_only(midi, source_name, target_name, note_map):
     # copia apenas notas, cria destino vazio se origem não existir
-    target = ensure_track(midi, target_name)
-    source = get_track_by_name(midi, source_name)
-    if source is None:
-        print(f"Track '{source_name}' not found, '{target_name}' stays empty.")
+    with stage(f"copy notes {target_name}") as record:
+        target = ensure_track(midi, target_name)
+        source = get_track_by_name(midi, source_name)
+        if source is None:
+            log_step(f"Track '{source_name}' not found, '{target_name}' stays empty.")
+            return target
+        count = _message_count(target)
+        if isinstance(midi, RawMidi):
+            _copy_raw_notes(target, source, note_map)
+        else:
+            cumulative_time = 0
+            for msg in source:
+                cumulative_time += msg.time
+                if msg.type in ["note_on", "note_off"] and msg.note in note_map:
+                    destinos = note_map[msg.note]
+                    if not isinstance(destinos, (list, tuple)):
+                        destinos = [destinos]
+                    for i, new_note in enumerate(destinos):
+                        target.append(Message(msg.type,
+                                              note=new_note,
+                                              velocity=msg.velocity,
+                                              time=cumulative_time if i == 0 else 0))
+                    cumulative_time = 0
+        record["read"] += _message_count(source)
+        record["emitted"] += _message_count(target) - count
+        log_step(f"'{source_name}' notes copied to '{target_name}'")
         return target
-    cumulative_time = 0
-    for msg in source:
-        cumulative_time += msg.time
-        if msg.type in ["note_on", "note_off"] and msg.note in note_map:
-            destinos = note_map[msg.note]
+
+####################################################################################################################################################
+
+class NoteRanks:
+    # ordem das notas de uma stream no mesmo tick (os eventos são 0): note_on = 2; note_off (ou note_on com
+    # velocity 0) que fecha uma nota ligada num tick anterior = 1, vai antes dos note_on; o note_off de uma nota
+    # ligada no próprio tick (duração zero) = 2, fica na ordem da origem junto dos note_on
+    # chamado com cada nota na ordem da stream; next_tick() quando o tick muda
+    def __init__(self):
+        self.held = {} # nota -> quantas ligadas antes do tick atual
+        self.new = {} # nota -> quantas ligadas no tick atual
+
+    def next_tick(self):
+        if self.new:
+            for note, count in self.new.items():
+                self.held[note] = self.held.get(note, 0) + count
+            self.new = {}
+
+    def __call__(self, note, on):
+        if on:
+            self.new[note] = self.new.get(note, 0) + 1
+            return 2
+        if self.held.get(note):
+            self.held[note] -= 1
+            return 1
+        if self.new.get(note):
+            self.new[note] -= 1
+            return 2
+        return 1 # note_off sem nota ligada
+
+def _stream_track(track, layer, note_map=None, keep_events=True):
+    # gera (tick, rank, layer, seq, msg) em ordem, sem copiar a track inteira;
+    # só o grupo de mensagens do mesmo tick é ordenado (pelo rank do NoteRanks)
+    # note_map None mantém as notas como estão; senão remapeia (e descarta as que não estão no mapa)
+    group = []
+    abs_time = 0
+    seq = 0
+    ranks = NoteRanks()
+    for msg in track:
+        if msg.time:
+            if group:
+                group.sort()
+                yield from group
+                group = []
+            ranks.next_tick()
+        abs_time += msg.time
+        if msg.type in ("note_on", "note_off"):
+            on = msg.type == "note_on" and msg.velocity > 0
+            if note_map is None:
+                group.append((abs_time, ranks((msg.channel, msg.note), on), layer, seq, msg))
+                seq += 1
+                continue
+            destinos = note_map.get(msg.note)
+            if destinos is None:
+                continue
             if not isinstance(destinos, (list, tuple)):
-                destinos = [destinos]
-            for i, new_note in enumerate(destinos):
-                target.append(Message(msg.type,
-                                      note=new_note,
-                                      velocity=msg.velocity,
-                                      time=cumulative_time if i == 0 else 0))
-            cumulative_time = 0
-    print(f"'{source_name}' notes copied to '{target_name}'")
-    return target
+                destinos = (destinos,)
+            for new_note in destinos:
+                group.append((abs_time, ranks(new_note, on), layer, seq,
+                              Message(msg.type, note=new_note, velocity=msg.velocity)))
+                seq += 1
+        elif keep_events and msg.type != "track_name":
+            group.append((abs_time, 0, layer, seq, msg))
+            seq += 1
+    group.sort()
+    yield from group
+
+def _emit_track(track_name, streams, validator=None):
+    # k-way merge (heap) das streams já ordenadas direto para uma MidiTrack nova
+    # os end_of_track das origens viram um só no fim (no maior tick entre eles e a última mensagem)
+    # validator = EventValidator que corrige os textos enquanto a track é escrita (validação na mesma passada)
+    track = MidiTrack([MetaMessage("track_name", name=track_name)])
+    prev = 0
+    end = 0
+    for t, rank, layer, seq, msg in heapq.merge(*streams):
+        if msg.type == "end_of_track":
+            end = t
+            continue
+        if validator is not None and msg.type == "text":
+            track.append(msg.copy(text=validator(t, msg.text), time=t - prev))
+        else:
+            track.append(msg.copy(time=t - prev))
+        prev = t
+    track.append(MetaMessage("end_of_track", time=max(end - prev, 0)))
+    return track
 
 ####################################################################################################################################################
 
-def merge_tracks(midi, name_a, name_b, merged_name="MERGED"):
-    # mescla mesmo se uma ou ambas as tracks faltarem (gera vazia se preciso)
-    track_a = get_track_by_name(midi, name_a)
-    track_b = get_track_by_name(midi, name_b)
-    if track_a is None and track_b is None:
-        merged = MidiTrack([MetaMessage("track_name", name=merged_name)])
+# --------------------------------------------
+# Engine NumPy (opcional): tracks em colunas e remapeamento por tabela
+# --------------------------------------------
+
+_note_luts = {}
+
+def compile_note_map(note_map):
+    # tabelas de 128 posições: quantas notas de destino cada nota gera e quais são (fan-out tipo 116)
+    key = tuple(sorted((note, tuple(destinos) if isinstance(destinos, (list, tuple)) else (destinos,))
+                       for note, destinos in note_map.items()))
+    lut = _note_luts.get(key)
+    if lut is None:
+        width = max([len(destinos) for note, destinos in key] + [1])
+        counts = np.zeros(128, dtype=np.int64)
+        targets = np.zeros((128, width), dtype=np.int64)
+        for note, destinos in key:
+            if 0 <= note < 128:
+                counts[note] = len(destinos)
+                targets[note, :len(destinos)] = destinos
+        lut = (counts, targets)
+        _note_luts[key] = lut
+    return lut
+
+def track_columns(track):
+    # decodifica a track em colunas paralelas (tick absoluto, note_on?, nota, velocity, índice da mensagem)
+    # os eventos que não são nota ficam numa lista à parte: [(tick, índice, msg)]
+    ticks, ons, notes, velocities, index = [], [], [], [], []
+    events = []
+    abs_time = 0
+    for i, msg in enumerate(track):
+        abs_time += msg.time
+        msg_type = msg.type
+        if msg_type == "note_on" or msg_type == "note_off":
+            ticks.append(abs_time)
+            ons.append(msg_type == "note_on")
+            notes.append(msg.note)
+            velocities.append(msg.velocity)
+            index.append(i)
+        elif msg_type != "track_name":
+            events.append((abs_time, i, msg))
+    columns = (np.array(ticks, dtype=np.int64), np.array(ons, dtype=bool), np.array(notes, dtype=np.int64),
+               np.array(velocities, dtype=np.int64), np.array(index, dtype=np.int64))
+    return columns, events
+
+def remap_columns(columns, note_map):
+    # remapeia as notas pela tabela; o fan-out vira um np.repeat (sem laço por mensagem)
+    ticks, ons, notes, velocities, index = columns
+    counts, targets = compile_note_map(note_map)
+    fan = counts[notes]
+    rows = np.repeat(np.arange(len(notes)), fan)
+    position = np.arange(len(rows)) - np.repeat(np.cumsum(fan) - fan, fan)
+    new_notes = targets[notes[rows], position]
+    # seq = índice da mensagem * 128 + posição no fan-out, mesma ordem do engine python
+    seq = index[rows] * 128 + position
+    return ticks[rows], ons[rows], new_notes, velocities[rows], seq
+
+def _note_ranks_numpy(ticks, ons, notes):
+    # mesmo rank do NoteRanks para as colunas de uma stream (ons = note_on com velocity > 0)
+    # sem nota de duração zero (note_off depois de um note_on da mesma nota no mesmo tick) todo note_off é 1;
+    # se tiver, o NoteRanks roda nas notas em python
+    rank = np.where(ons, 2, 1)
+    if len(ticks) == 0:
+        return rank
+    order = np.lexsort((np.arange(len(ticks)), ticks, notes))
+    sorted_ons = ons[order].astype(np.int64)
+    sorted_ticks = ticks[order]
+    sorted_notes = notes[order]
+    # note_on antes de cada posição, e no começo do grupo (mesma nota e tick) dela
+    before = np.cumsum(sorted_ons) - sorted_ons
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sorted_notes[1:] != sorted_notes[:-1]) | (sorted_ticks[1:] != sorted_ticks[:-1])
+    start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+    if np.any((sorted_ons == 0) & (before > before[start])):
+        ranks = NoteRanks()
+        last = None
+        for i, (tick, on, note) in enumerate(zip(ticks.tolist(), ons.tolist(), notes.tolist())):
+            if tick != last:
+                ranks.next_tick()
+                last = tick
+            rank[i] = ranks(note, on)
+    return rank
+
+def _emit_track_numpy(track_name, sources, validator=None):
+    # mesma saída do _emit_track, mas o merge é um lexsort por (tick, rank, layer, seq)
+    # sources = [(layer, track, note_map, keep_events)]
+    parts = []
+    events = []
+    for layer, track, note_map, keep_events in sources:
+        columns, track_events = track_columns(track)
+        ticks, ons, notes, velocities, seq = remap_columns(columns, note_map)
+        rank = _note_ranks_numpy(ticks, ons & (velocities > 0), notes)
+        parts.append((ticks, rank, np.full(len(ticks), layer), seq, ons, notes, velocities,
+                      np.full(len(ticks), -1)))
+        if keep_events and track_events:
+            n = len(track_events)
+            event_ticks = np.array([t for t, i, msg in track_events], dtype=np.int64)
+            event_seq = np.array([i for t, i, msg in track_events], dtype=np.int64) * 128
+            parts.append((event_ticks, np.zeros(n, dtype=np.int64), np.full(n, layer), event_seq,
+                          np.zeros(n, dtype=bool), np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64),
+                          np.arange(len(events), len(events) + n)))
+            events.extend(msg for t, i, msg in track_events)
+    track = MidiTrack([MetaMessage("track_name", name=track_name)])
+    prev = 0
+    end = 0
+    if parts:
+        ticks, rank, layers, seq, ons, notes, velocities, event_index = (np.concatenate(column) for column in zip(*parts))
+        order = np.lexsort((seq, layers, rank, ticks))
+        ticks, ons, notes, velocities, event_index = (column[order].tolist() for column in
+                                                      (ticks, ons, notes, velocities, event_index))
+        for t, on, note, velocity, e in zip(ticks, ons, notes, velocities, event_index):
+            if e >= 0:
+                msg = events[e]
+                if msg.type == "end_of_track":
+                    end = t
+                    continue
+                if validator is not None and msg.type == "text":
+                    track.append(msg.copy(text=validator(t, msg.text), time=t - prev))
+                else:
+                    track.append(msg.copy(time=t - prev))
+            else:
+                track.append(Message("note_on" if on else "note_off", note=note, velocity=velocity, time=t - prev))
+            prev = t
+    track.append(MetaMessage("end_of_track", time=max(end - prev, 0)))
+    return track
+
+####################################################################################################################################################
+
+def merge_tracks(midi, *track_names, merged_name="MERGED"):
+    # mescla N tracks mesmo se alguma ou todas faltarem (gera vazia se preciso)
+    with stage(f"merge {merged_name}") as record:
+        tracks = [get_track_by_name(midi, name) for name in track_names]
+        names = " + ".join(f"'{name}'" for name in track_names)
+        raw = isinstance(midi, RawMidi)
+        if all(track is None for track in tracks):
+            if raw:
+                merged = RawTrack([merged_name], events=[_raw_track_name_event(merged_name)])
+            else:
+                merged = MidiTrack([MetaMessage("track_name", name=merged_name)])
+            midi.tracks.append(merged)
+            _index_add(midi, merged, merged_name)
+            log_step(f"No {' or '.join(repr(name) for name in track_names)} to merge; created empty '{merged_name}'.")
+            return merged
+        if raw:
+            merged = _emit_raw_track(merged_name, [_stream_raw_track(track, layer, None, True)
+                                                   for layer, track in enumerate(tracks) if track is not None])
+        else:
+            merged = _emit_track(merged_name, [_stream_track(track, layer)
+                                               for layer, track in enumerate(tracks) if track is not None])
         midi.tracks.append(merged)
-        print(f"No '{name_a}' or '{name_b}' to merge; created empty '{merged_name}'.")
+        _index_add(midi, merged, merged_name)
+        record["read"] += sum(_message_count(track) for track in tracks)
+        record["emitted"] += _message_count(merged)
+        log_step(f"Merged {names} into '{merged_name}'")
         return merged
-    events = []
-    for track in (track_a, track_b):
-        if track is None:
+
+####################################################################################################################################################
+
+def build_track(midi, target_name, layers, replace=(), cache=None, deps=None, extra=(), engine="python",
+                validate=False):
+    # monta a track final numa passada só, sem tracks temporárias
+    # layers = [(source_name, note_map, keep_events)], na ordem de prioridade das notas no mesmo tick
+    # replace = tracks deletadas antes de adicionar a nova (normalmente as próprias origens)
+    # cache = TrackCache; deps = tracks da entrada de que a saída depende (padrão: as origens das layers)
+    # engine = "python" (heap merge) ou "numpy" (colunas + lexsort, se o numpy estiver instalado)
+    # validate = valida os eventos de texto enquanto escreve (os avisos vão para o validate_midi_events)
+    with stage(f"build {target_name}") as record:
+        if cache is not None:
+            if deps is None:
+                deps = [layer[0] for layer in layers]
+            params = [[source_name, sorted(note_map.items()), keep_events] for source_name, note_map, keep_events in layers]
+            key = step_key(midi, cache, target_name, deps, [params, list(replace), validate] + list(extra), replace)
+            return cached_step(midi, cache.dir, key, target_name,
+                               lambda: build_track(midi, target_name, layers, replace, engine=engine,
+                                                   validate=validate), replace)
+        sources = []
+        for layer, (source_name, note_map, keep_events) in enumerate(layers):
+            source = get_track_by_name(midi, source_name)
+            if source is None:
+                log_step(f"Track '{source_name}' not found, skipped in '{target_name}'.")
+                continue
+            sources.append((layer, source, note_map, keep_events))
+        validator = EventValidator(target_name, get_tempo_map(midi)) if validate else None
+        # eventos antes das notas no mesmo tick, note_off (de nota ligada antes) antes de note_on, depois pela ordem das layers
+        if isinstance(midi, RawMidi):
+            target = _emit_raw_track(target_name, [_stream_raw_track(track, layer, note_map, keep_events)
+                                                   for layer, track, note_map, keep_events in sources], validator)
+        elif engine == "numpy" and np is not None:
+            target = _emit_track_numpy(target_name, sources, validator)
+        else:
+            target = _emit_track(target_name, [_stream_track(track, layer, note_map, keep_events)
+                                               for layer, track, note_map, keep_events in sources], validator)
+        if validator is not None:
+            _mark_validated(midi, target, target_name, validator.diagnostics)
+        record["read"] += sum(_message_count(source[1]) for source in sources)
+        record["emitted"] += _message_count(target)
+        for name in replace:
+            delete_track(midi, name)
+        midi.tracks.append(target)
+        _index_add(midi, target, target_name)
+        log_step(f"'{target_name}' built from {', '.join(repr(layer[0]) for layer in layers)}")
+        return target
+
+####################################################################################################################################################
+
+def convert_part(midi, part_name, ghl_name=None, big_note_name=None, cache=None, engine="python"):
+    # converte uma PART (GUITAR/BASS/COOP/RHYTHM) numa chamada: eventos + notas,
+    # fretmap da track GHL e BIG-NOTE do PART KEYS; apaga a origem e a GHL
+    # os eventos de texto são validados na mesma passada
+    layers = []
+    if ghl_name:
+        layers.append((ghl_name, fretmapping_notes, False))
+    if big_note_name:
+        layers.append((big_note_name, big_note_notes, False))
+    layers.append((part_name, instrument_notes, True))
+    replace = [part_name] + ([ghl_name] if ghl_name else [])
+    # no cache, do PART KEYS só conta a lane do BIG-NOTE (mexer nos keyframes não invalida a guitarra)
+    deps = replace
+    extra = [_lane_hash(midi, big_note_name, big_note_notes)] if big_note_name and cache is not None else []
+    return build_track(midi, part_name, layers, replace=replace, cache=cache, deps=deps, extra=extra, engine=engine,
+                       validate=part_name in VALIDATED_TRACKS)
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Leitura crua de SMF e cache de tracks
+# --------------------------------------------
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, pos
+
+def _raw_track_name(chunk):
+    # primeiro track_name do chunk MTrk (sem o cabeçalho), lendo só até achá-lo
+    pos = 0
+    status = None
+    while pos < len(chunk):
+        delta, pos = _read_varlen(chunk, pos)
+        byte = chunk[pos]
+        if byte == 0xff:
+            meta_type = chunk[pos + 1]
+            length, pos = _read_varlen(chunk, pos + 2)
+            if meta_type == 0x03:
+                return bytes(chunk[pos:pos + length]).decode("latin1")
+            pos += length
+        elif byte in (0xf0, 0xf7):
+            length, pos = _read_varlen(chunk, pos + 1)
+            pos += length
+        else:
+            if byte >= 0x80:
+                status = byte
+                pos += 1
+            elif status is None:
+                raise ValueError("running status without last status")
+            pos += 1 if 0xc0 <= status <= 0xdf else 2
+    return None
+
+def read_raw_tracks(data):
+    # divide o SMF nos chunks MTrk sem criar objetos do mido: [(nome, bytes do chunk)]
+    if bytes(data[0:4]) != b"MThd":
+        raise ValueError("MThd not found. Probably not a MIDI file")
+    pos = 8 + int.from_bytes(data[4:8], "big")
+    tracks = []
+    while pos + 8 <= len(data):
+        chunk_type = bytes(data[pos:pos + 4])
+        size = int.from_bytes(data[pos + 4:pos + 8], "big")
+        chunk = data[pos + 8:pos + 8 + size]
+        if chunk_type == b"MTrk":
+            tracks.append((_raw_track_name(chunk), chunk))
+        pos += 8 + size
+    return tracks
+
+def track_hashes(data):
+    # sha256 dos bytes crus de cada track, pelo nome (primeira track com o nome, igual ao get_track_by_name)
+    hashes = {}
+    for name, chunk in read_raw_tracks(data):
+        if name is not None and name not in hashes:
+            hashes[name] = hashlib.sha256(chunk).hexdigest()
+    return hashes
+
+def _lane_hash(midi, track_name, notes):
+    # hash só das notas escolhidas de uma track (ex.: nota 100 do PART KEYS para o BIG-NOTE)
+    track = get_track_by_name(midi, track_name)
+    if track is None:
+        return None
+    if isinstance(track, RawTrack):
+        return _raw_lane_hash(track, notes)
+    h = hashlib.sha256()
+    abs_time = 0
+    for msg in track:
+        abs_time += msg.time
+        if msg.type in ("note_on", "note_off") and msg.note in notes:
+            h.update(f"{abs_time},{msg.type},{msg.note},{msg.velocity};".encode())
+    return h.hexdigest()
+
+def encode_track(track):
+    # uma track vira um SMF pequeno (bytes), do jeito que o midi.save escreveria
+    if isinstance(track, RawTrack):
+        chunk = track.chunk_bytes()
+        return b"MThd\x00\x00\x00\x06\x00\x01\x00\x01\x01\xe0MTrk" + len(chunk).to_bytes(4, "big") + bytes(chunk)
+    buffer = io.BytesIO()
+    MidiFile(type=1, tracks=[track]).save(file=buffer)
+    return buffer.getvalue()
+
+def decode_track(data):
+    return MidiFile(file=io.BytesIO(data)).tracks[0]
+
+def cache_get(cache_dir, key):
+    # o acerto atualiza o mtime, que o prune_track_cache usa como último uso
+    path = os.path.join(cache_dir, key + ".mid")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+def cache_put(cache_dir, key, data):
+    # grava num temporário e troca (workers paralelos podem gravar a mesma chave)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".mid")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def prune_track_cache(cache_dir, max_bytes=TRACK_CACHE_MAX_BYTES):
+    # apaga as entradas usadas há mais tempo (e temporários esquecidos) até a pasta caber em max_bytes
+    # as chaves são hashes de conteúdo, sem ligação com o arquivo de origem, então o limite é por tamanho
+    entries = []
+    try:
+        with os.scandir(cache_dir) as found:
+            for entry in found:
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, entry.path))
+    except OSError:
+        return 0
+    total = sum(size for mtime, size, path in entries)
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
             continue
-        abs_time = 0
-        for msg in track:
-            abs_time += msg.time
-            if msg.type != "track_name":
-                events.append((abs_time, msg))
-    merged = MidiTrack([MetaMessage("track_name", name=merged_name)])
+        total -= size
+        removed += 1
+    return removed
+
+def cached_step(midi, cache_dir, key, output_name, build, replace=()):
+    # reaproveita a track de saída do cache (mesmos bytes) ou roda build() e guarda o resultado
+    # replace = tracks que o build() apagaria; no acerto do cache elas são apagadas do mesmo jeito
+    if cache_dir is None or key is None:
+        return build()
+    data = cache_get(cache_dir, key)
+    if data is not None:
+        try:
+            track = _decode_raw_cached_track(data) if isinstance(midi, RawMidi) else decode_track(data)
+        except Exception:
+            track = None
+        if track is not None:
+            with stage(f"cache {output_name}") as record:
+                for name in replace:
+                    delete_track(midi, name)
+                midi.tracks.append(track)
+                _index_add(midi, track, output_name)
+                record["cached"] = True
+                log_step(f"'{output_name}' reused from cache")
+            return track
+    track = build()
+    cache_put(cache_dir, key, encode_track(track))
+    return track
+
+# cache de um arquivo: pasta do cache + hash das tracks cruas da entrada (track_hashes)
+TrackCache = collections.namedtuple("TrackCache", ["dir", "hashes"])
+
+def step_key(midi, cache, output_name, deps, extra=(), replace=()):
+    # chave de uma track de saída: versão + nome + parâmetros do passo + hash das tracks de origem
+    if cache is None or cache.hashes is None:
+        return None
+    if output_name not in replace and get_track_by_name(midi, output_name) is not None:
+        return None  # a saída já existe na entrada, o resultado depende dela; não usa cache
+    key = [CONVERTER_VERSION, output_name, list(extra), [cache.hashes.get(name) for name in deps]]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Caminho rápido: conversão direto nos bytes do SMF (sem objetos do mido)
+# --------------------------------------------
+
+class RawUnsupported(ValueError):
+    # o caminho rápido não reescreveria igual ao mido; a conversão volta para o caminho do mido
+    pass
+
+# metas que o mido lê e escreve de volta com os mesmos bytes: tipo -> tamanho exigido (None = qualquer)
+# textos (0x01-0x07, 0x09), sequencer_specific e metas desconhecidos passam direto
+_RAW_META_SIZES = {0x00: 2, 0x20: 1, 0x21: 1, 0x2f: None, 0x51: 3, 0x58: 4}
+_RAW_META_UNSUPPORTED = (0x54, 0x59) # smpte_offset, key_signature: o mido normaliza/valida
+
+_VARLEN = [bytes((value,)) for value in range(128)]
+
+def _varlen(value):
+    if value < 128:
+        return _VARLEN[value]
+    out = bytearray((value & 0x7f,))
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7f) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+def _meta_bytes(meta_type, data):
+    return bytes((0xff, meta_type)) + _varlen(len(data)) + data
+
+def _walk_raw_track(chunk, keep_events):
+    # percorre um chunk MTrk (memoryview) como o mido leria: retorna (nomes, eventos, canônico)
+    # eventos = [(tick absoluto, bytes da mensagem com status explícito)] se keep_events
+    # canônico = o mido escreveria exatamente estes bytes (então o chunk pode ir direto para a saída)
+    names = []
+    events = [] if keep_events else None
+    canonical = True
+    pos = 0
+    size = len(chunk)
+    tick = 0
+    status = None # running status da leitura (metas não mudam, igual ao mido)
+    running = None # running status da escrita do mido (metas e sysex zeram)
+    end_of_track = 0
+    try:
+        while pos < size:
+            start = pos
+            delta, pos = _read_varlen(chunk, pos)
+            if chunk[start] == 0x80:
+                canonical = False # delta com zeros à esquerda
+            tick += delta
+            byte = chunk[pos]
+            if byte == 0xff:
+                meta_type = chunk[pos + 1]
+                length, data_pos = _read_varlen(chunk, pos + 2)
+                end = data_pos + length
+                if end > size:
+                    raise RawUnsupported("truncated meta event")
+                if meta_type in _RAW_META_UNSUPPORTED:
+                    raise RawUnsupported(f"meta event 0x{meta_type:02x}")
+                expected = _RAW_META_SIZES.get(meta_type, length)
+                if meta_type == 0x2f:
+                    end_of_track += 1
+                    if length or end != size or end_of_track > 1:
+                        canonical = False
+                    if keep_events:
+                        events.append((tick, b"\xff\x2f\x00"))
+                elif expected != length:
+                    raise RawUnsupported(f"meta event 0x{meta_type:02x} with {length} bytes")
+                else:
+                    if chunk[pos + 2] == 0x80:
+                        canonical = False
+                    if meta_type == 0x03:
+                        name = bytes(chunk[data_pos:end]).decode("latin1")
+                        if name not in names:
+                            names.append(name)
+                    if meta_type == 0x58 and chunk[data_pos + 1] > 30:
+                        raise RawUnsupported("time signature denominator")
+                    if keep_events:
+                        events.append((tick, _meta_bytes(meta_type, bytes(chunk[data_pos:end]))))
+                running = None
+                pos = end
+            elif byte == 0xf0 or byte == 0xf7:
+                length, data_pos = _read_varlen(chunk, pos + 1)
+                end = data_pos + length
+                if end > size:
+                    raise RawUnsupported("truncated sysex")
+                data = bytes(chunk[data_pos:end])
+                # o mido tira o F0/F7 das pontas e reescreve como F0 <tamanho> dados F7
+                stripped = data[1:] if data[:1] == b"\xf0" else data
+                stripped = stripped[:-1] if stripped[-1:] == b"\xf7" else stripped
+                payload = b"\xf0" + _varlen(len(stripped) + 1) + stripped + b"\xf7"
+                if byte == 0xf7 or payload != bytes(chunk[pos:end]):
+                    canonical = False
+                if keep_events:
+                    events.append((tick, payload))
+                status = byte
+                running = None
+                pos = end
+            else:
+                if byte >= 0x80:
+                    status = byte
+                    pos += 1
+                    explicit = True
+                elif status is None:
+                    raise RawUnsupported("running status without last status")
+                else:
+                    explicit = False
+                if status >= 0xf0:
+                    raise RawUnsupported(f"status byte 0x{status:02x}")
+                length = 1 if 0xc0 <= status <= 0xdf else 2
+                data = chunk[pos:pos + length]
+                if len(data) < length or max(data) > 127:
+                    raise RawUnsupported("bad channel message data")
+                if explicit != (status != running):
+                    canonical = False
+                running = status
+                if keep_events:
+                    events.append((tick, bytes((status,)) + bytes(data)))
+                pos += length
+    except IndexError:
+        raise RawUnsupported("truncated track")
+    if pos != size:
+        raise RawUnsupported("event runs past the end of the track")
+    if end_of_track == 0:
+        canonical = False
+    return names, events, canonical
+
+def _encode_raw_events(events):
+    # escreve os eventos como o mido.save: running status, um end_of_track só no fim
+    out = bytearray()
     prev = 0
-    for t, msg in sorted(events, key=lambda x: x[0]):
-        merged.append(msg.copy(time=t - prev))
-        prev = t
-    midi.tracks.append(merged)
-    print(f"Merged '{name_a}' + '{name_b}' into '{merged_name}'")
-    return merged
+    running = None
+    for tick, payload in events:
+        if payload[0] == 0xff and payload[1] == 0x2f:
+            continue
+        out += _varlen(tick - prev)
+        prev = tick
+        status = payload[0]
+        if status < 0xf0:
+            out += payload[1:] if status == running else payload
+            running = status
+        else:
+            out += payload
+            running = None
+    end = events[-1][0] if events else 0
+    out += _varlen(end - prev)
+    out += b"\xff\x2f\x00"
+    return bytes(out)
+
+class RawTrack:
+    # track lida direto dos bytes: nomes, chunk original (enquanto não for alterada) e eventos sob demanda
+    def __init__(self, names, chunk=None, canonical=False, events=None):
+        self.names = names
+        self.chunk = chunk
+        self.canonical = canonical
+        self._events = events
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = _walk_raw_track(self.chunk, True)[1]
+        return self._events
+
+    def modified(self):
+        # a partir daqui a track é escrita a partir dos eventos
+        self._events = self.events
+        self.chunk = None
+        self.canonical = False
+
+    def chunk_bytes(self):
+        if self.chunk is not None and self.canonical:
+            return self.chunk
+        return _encode_raw_events(self.events)
+
+    def __iter__(self):
+        raise RawUnsupported("raw tracks can't be iterated as mido messages")
+
+class RawMidi:
+    # SMF lido direto dos bytes (tipo 1); tracks = [RawTrack]
+    def __init__(self, data):
+        if bytes(data[0:4]) != b"MThd":
+            raise RawUnsupported("MThd not found")
+        header_size = int.from_bytes(data[4:8], "big")
+        if header_size < 6:
+            raise RawUnsupported("short MThd")
+        self.type = int.from_bytes(data[8:10], "big")
+        if self.type != 1:
+            raise RawUnsupported(f"type {self.type} MIDI file")
+        count = int.from_bytes(data[10:12], "big")
+        self.division = bytes(data[12:14])
+        self.ticks_per_beat = int.from_bytes(self.division, "big", signed=True)
+        self.tracks = []
+        self.hashes = {}
+        pos = 8 + header_size
+        for i in range(count):
+            if pos + 8 > len(data) or bytes(data[pos:pos + 4]) != b"MTrk":
+                raise RawUnsupported("no MTrk header at start of track")
+            size = int.from_bytes(data[pos + 4:pos + 8], "big")
+            chunk = data[pos + 8:pos + 8 + size]
+            if len(chunk) != size:
+                raise RawUnsupported("truncated track")
+            names, events, canonical = _walk_raw_track(chunk, False)
+            self.tracks.append(RawTrack(names, chunk, canonical))
+            if names and names[0] not in self.hashes:
+                self.hashes[names[0]] = hashlib.sha256(chunk).hexdigest()
+            pos += 8 + size
+
+    def save(self, filename=None, file=None):
+        # mesma assinatura do MidiFile.save: caminho ou objeto de arquivo
+        if file is None:
+            with open(filename, "wb") as f:
+                return self.save(file=f)
+        file.write(b"MThd" + (6).to_bytes(4, "big") + self.type.to_bytes(2, "big")
+                   + len(self.tracks).to_bytes(2, "big") + self.division)
+        for track in self.tracks:
+            chunk = track.chunk_bytes()
+            file.write(b"MTrk" + len(chunk).to_bytes(4, "big"))
+            file.write(chunk)
+
+def _raw_track_name_event(name):
+    return (0, _meta_bytes(0x03, name.encode("latin1")))
+
+def _stream_raw_track(track, layer, note_map, keep_events):
+    # mesma ordem do _stream_track, com os bytes crus no lugar das mensagens do mido
+    # note_map None mantém as notas como estão (canal incluído), como no _stream_track
+    group = []
+    last_tick = None
+    seq = 0
+    ranks = NoteRanks()
+    for tick, payload in track.events:
+        if tick != last_tick:
+            if group:
+                group.sort()
+                yield from group
+                group = []
+            ranks.next_tick()
+        last_tick = tick
+        status = payload[0]
+        if 0x80 <= status <= 0x9f:
+            if note_map is None:
+                on = status >= 0x90 and payload[2] > 0
+                group.append((tick, ranks((status & 0x0f, payload[1]), on), layer, seq, payload))
+                seq += 1
+                continue
+            destinos = note_map.get(payload[1])
+            if destinos is None:
+                continue
+            if not isinstance(destinos, (list, tuple)):
+                destinos = (destinos,)
+            velocity = payload[2]
+            new_status = 0x90 if status >= 0x90 else 0x80
+            on = new_status == 0x90 and velocity > 0
+            for new_note in destinos:
+                group.append((tick, ranks(new_note, on), layer, seq, bytes((new_status, new_note, velocity))))
+                seq += 1
+        elif keep_events and not (status == 0xff and payload[1] == 0x03):
+            group.append((tick, 0, layer, seq, payload))
+            seq += 1
+    group.sort()
+    yield from group
+
+def _emit_raw_track(track_name, streams, validator=None):
+    # k-way merge das streams cruas, com o end_of_track no fim como o _emit_track
+    events = [_raw_track_name_event(track_name)]
+    prev = 0
+    end = 0
+    for tick, rank, layer, seq, payload in heapq.merge(*streams):
+        if payload[0] == 0xff:
+            if payload[1] == 0x2f:
+                end = tick
+                continue
+            if payload[1] == 0x01 and validator is not None:
+                length, data_pos = _read_varlen(payload, 2)
+                text = payload[data_pos:].decode("latin1")
+                fixed = validator(tick, text)
+                if fixed != text:
+                    payload = _meta_bytes(0x01, fixed.encode("latin1"))
+        events.append((tick, payload))
+        prev = tick
+    events.append((max(end, prev), b"\xff\x2f\x00"))
+    return RawTrack([track_name], events=events)
+
+def _copy_raw_events(target, source):
+    # igual ao copy_events_only: os eventos entram depois do último evento da track de destino
+    base = target.events[-1][0] if target.events else 0
+    for tick, payload in source.events:
+        status = payload[0]
+        if 0x80 <= status <= 0x9f or (status == 0xff and payload[1] == 0x03):
+            continue
+        target.events.append((base + tick, payload))
+    target.modified()
+
+def _copy_raw_notes(target, source, note_map):
+    # igual ao copy_notes_only: notas remapeadas (no canal 0) depois do último evento da track de destino
+    base = target.events[-1][0] if target.events else 0
+    for tick, payload in source.events:
+        status = payload[0]
+        if 0x80 <= status <= 0x9f and payload[1] in note_map:
+            destinos = note_map[payload[1]]
+            if not isinstance(destinos, (list, tuple)):
+                destinos = [destinos]
+            for new_note in destinos:
+                target.events.append((base + tick, bytes((status & 0xf0, new_note, payload[2]))))
+    target.modified()
+
+def _rename_raw_track(track, old_name, new_name):
+    # igual ao rename_track_by_name: troca os track_name com o nome antigo
+    events = track.events
+    for i, (tick, payload) in enumerate(events):
+        if payload[0] == 0xff and payload[1] == 0x03 and _read_track_name(payload) == old_name:
+            events[i] = (tick, _meta_bytes(0x03, new_name.encode("latin1")))
+    track.names = [new_name if name == old_name else name for name in track.names]
+    track.modified()
+
+def _raw_lane_hash(track, notes):
+    # mesmo hash do _lane_hash, direto dos eventos crus
+    h = hashlib.sha256()
+    for tick, payload in track.events:
+        if 0x80 <= payload[0] <= 0x9f and payload[1] in notes:
+            msg_type = "note_on" if payload[0] >= 0x90 else "note_off"
+            h.update(f"{tick},{msg_type},{payload[1]},{payload[2]};".encode())
+    return h.hexdigest()
+
+def _decode_raw_cached_track(data):
+    # track do cache (SMF de uma track, gravado pelo encode_track) como RawTrack
+    return RawMidi(memoryview(data)).tracks[0]
+
+def convert_file_raw(view, targets, cache_dir=None):
+    # converte pelo caminho rápido; levanta RawUnsupported se algo precisar do mido
+    # targets = [(opções, arquivo de saída)], como no save_variants
+    with stage("load") as record:
+        midi = RawMidi(view)
+        record["bytes"] = len(view)
+    cache = TrackCache(cache_dir, midi.hashes) if cache_dir is not None else None
+    return save_variants(midi, targets, cache)
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Normalização da saída (no lugar do re-export no REAPER)
+# --------------------------------------------
+
+# ordem das tracks no arquivo final, depois da track de tempo; as que não estão aqui vão para o fim na ordem original
+TRACK_ORDER = {name: i for i, name in enumerate(["PART GUITAR", "PART GUITAR COOP", "PART BASS", "PART RHYTHM",
+                                                 "BAND BASS", "BAND DRUMS", "BAND SINGER", "BAND KEYS",
+                                                 "EVENTS", "TRIGGERS"])}
+
+def _mido_timeline(track):
+    # (tick, tipo, (canal, nota), mensagem) na ordem do arquivo
+    # tipo: -1 track_name, 0 evento, 1 note_off (ou note_on com velocity 0), 2 note_on, 3 end_of_track
+    tick = 0
+    for msg in track:
+        tick += msg.time
+        msg_type = msg.type
+        if msg_type == "note_on":
+            yield tick, 1 if msg.velocity == 0 else 2, (msg.channel, msg.note), msg
+        elif msg_type == "note_off":
+            yield tick, 1, (msg.channel, msg.note), msg
+        elif msg_type == "track_name":
+            yield tick, -1, None, msg
+        elif msg_type == "end_of_track":
+            yield tick, 3, None, msg
+        else:
+            yield tick, 0, None, msg
+
+def _raw_timeline(track):
+    # mesmo que o _mido_timeline, direto dos eventos crus
+    for tick, payload in track.events:
+        status = payload[0]
+        if 0x90 <= status <= 0x9f:
+            yield tick, 1 if payload[2] == 0 else 2, (status & 0x0f, payload[1]), payload
+        elif 0x80 <= status <= 0x8f:
+            yield tick, 1, (status & 0x0f, payload[1]), payload
+        elif status == 0xff and payload[1] == 0x03:
+            yield tick, -1, None, payload
+        elif status == 0xff and payload[1] == 0x2f:
+            yield tick, 3, None, payload
+        else:
+            yield tick, 0, None, payload
+
+def _normalize_group(tick, group, notes, out):
+    # ordena e limpa as mensagens de um tick; notes = {(canal, nota): [abertas, tick do note_on, note_off a descartar,
+    # pares note_off/note_on do _drop_zero_length ainda ligados, como posições no out]}
+    # retorna True se algo mudou em relação à ordem original
+    changed = False
+    pairs = None
+    if len(group) == 1:
+        kind, key, item = group[0]
+        order = ((kind, key, 0),)
+    else:
+        # eventos na ordem original, depois note_off e note_on por canal/nota
+        order = sorted([(kind, key or (), i) for i, (kind, key, item) in enumerate(group)])
+        if order[-1][0] == 2 and any(kind == 1 for kind, key, i in order):
+            order, changed, pairs = _drop_zero_length(group, order, notes)
+        changed = changed or any(entry[2] != i for i, entry in enumerate(order))
+    positions = {}
+    for kind, key, i in order:
+        if kind == 1:
+            state = notes.get(key)
+            if state is not None:
+                if state[0]:
+                    state[0] -= 1
+                    if state[0] == 0:
+                        state[3].clear() # todas desligadas: os pares eram notas de verdade
+                elif state[2]:
+                    state[2] -= 1 # note_off de um note_on duplicado que foi removido
+                    changed = True
+                    continue
+        elif kind == 2:
+            state = notes.get(key)
+            if state is None:
+                notes[key] = [1, tick, 0, []]
+            elif state[0] == 0:
+                state[0] = 1
+                state[1] = tick
+            elif state[1] == tick:
+                state[2] += 1 # mesma nota ligada duas vezes no mesmo tick
+                changed = True
+                continue
+            else:
+                state[0] += 1
+        if pairs:
+            positions[i] = len(out)
+        out.append((tick, group[i][2]))
+    if pairs:
+        for on, off in pairs.items():
+            if on in positions and off in positions:
+                notes[group[on][1]][3].append((positions[off], positions[on]))
+    return changed
+
+def _drop_zero_length(group, order, notes):
+    # notas de duração zero: note_on e note_off da mesma nota no mesmo tick
+    # os primeiros note_off de cada nota fecham as notas abertas antes do tick; um note_off que sobra depois de
+    # um note_on do tick forma par com ele e os dois são removidos
+    # um note_off que sobra antes do note_on pode ser só um note_off solto antes de uma nota de verdade: o par
+    # volta em pairs ({note_on: note_off}) e o _normalize_timeline tira os dois se esse note_on nunca for desligado
+    lanes = {}
+    for i, (kind, key, item) in enumerate(group):
+        if kind == 1 or kind == 2:
+            lanes.setdefault(key, []).append((kind, i))
+    dropped = set()
+    pairs = {}
+    for key, items in lanes.items():
+        state = notes.get(key)
+        free = state[0] if state else 0
+        opened = [] # note_on do tick ainda sem par
+        waiting = [] # note_off sem nota para fechar, antes de um note_on do tick
+        for kind, i in items:
+            if kind == 2:
+                if waiting:
+                    pairs[i] = waiting.pop(0)
+                else:
+                    opened.append(i)
+            elif free:
+                free -= 1
+            elif opened:
+                dropped.add(opened.pop())
+                dropped.add(i)
+            else:
+                waiting.append(i)
+    if not dropped:
+        return order, False, pairs
+    return [entry for entry in order if entry[2] not in dropped], True, pairs
+
+def _normalize_timeline(timeline):
+    # uma passada pela track: retorna (track_name, [(tick, item)], tick do end_of_track, mudou?)
+    name = None
+    out = []
+    notes = {}
+    end = 0
+    changed = False
+    group = []
+    last_tick = None
+    position = 0
+    end_position = None
+    for tick, kind, key, item in timeline:
+        if tick != last_tick and group:
+            changed |= _normalize_group(last_tick, group, notes, out)
+            group = []
+        last_tick = tick
+        if kind == -1:
+            # só o primeiro track_name fica, no tick 0 antes de tudo
+            if name is None:
+                name = item
+                changed |= tick != 0 or position != 0
+            else:
+                changed = True
+        elif kind == 3:
+            changed |= end_position is not None
+            end_position = position
+            end = max(end, tick)
+        else:
+            group.append((kind, key, item))
+        position += 1
+    if group:
+        changed |= _normalize_group(last_tick, group, notes, out)
+    # note_off solto + note_on no mesmo tick cujo note_on nunca desligou: era uma nota de duração zero
+    dropped = set()
+    for state in notes.values():
+        if state[0] and state[3]:
+            for positions in state[3][-state[0]:]:
+                dropped.update(positions)
+    if dropped:
+        out = [entry for i, entry in enumerate(out) if i not in dropped]
+        changed = True
+    # um end_of_track só, como última mensagem
+    changed |= end_position != position - 1
+    if out:
+        end = max(end, out[-1][0])
+    return name, out, end, changed
+
+def _read_track_name(payload):
+    length, data_pos = _read_varlen(payload, 2)
+    return bytes(payload[data_pos:data_pos + length]).decode("latin1")
+
+def scale_tick(tick, ticks_per_beat):
+    # tick absoluto da origem -> GH2_TICKS_PER_BEAT, arredondado
+    return (tick * GH2_TICKS_PER_BEAT + ticks_per_beat // 2) // ticks_per_beat
+
+def rescale_diagnostics(diagnostics, ticks_per_beat):
+    # avisos com ticks da origem -> ticks do arquivo reescalado (a posição no texto não muda)
+    if ticks_per_beat <= 0 or ticks_per_beat == GH2_TICKS_PER_BEAT:
+        return list(diagnostics)
+    return [d._replace(tick=scale_tick(d.tick, ticks_per_beat)) for d in diagnostics]
+
+def _rescaled(timeline, ticks_per_beat, collisions):
+    # ticks da origem -> GH2_TICKS_PER_BEAT, arredondando o tick absoluto (o erro não acumula nos deltas)
+    # collisions recebe (tick de origem, nota) das notas que caem no mesmo tick do note_on anterior da mesma nota
+    last_on = {}
+    for tick, kind, key, item in timeline:
+        scaled = scale_tick(tick, ticks_per_beat)
+        if kind == 1 or kind == 2:
+            previous = last_on.pop(key, None)
+            if previous is not None and previous[1] == scaled and previous[0] != tick:
+                collisions.append((tick, key[1]))
+            if kind == 2:
+                last_on[key] = (tick, scaled)
+        yield scaled, kind, key, item
+
+def _normalize_track(track, ticks_per_beat=GH2_TICKS_PER_BEAT):
+    # retorna (track normalizada, nome, colisões do rescale); a própria track volta se já estava normalizada
+    raw = isinstance(track, RawTrack)
+    timeline = _raw_timeline(track) if raw else _mido_timeline(track)
+    collisions = []
+    rescale = ticks_per_beat != GH2_TICKS_PER_BEAT
+    if rescale:
+        timeline = _rescaled(timeline, ticks_per_beat, collisions)
+    name, events, end, changed = _normalize_timeline(timeline)
+    if raw:
+        track_name = _read_track_name(name) if name is not None else None
+        if not (changed or rescale):
+            return track, track_name, collisions
+        events = ([(0, name)] if name is not None else []) + events + [(end, b"\xff\x2f\x00")]
+        return RawTrack([track_name] if name is not None else [], events=events), track_name, collisions
+    track_name = name.name if name is not None else None
+    if not (changed or rescale):
+        return track, track_name, collisions
+    normalized = MidiTrack([name if name.time == 0 else name.copy(time=0)] if name is not None else [])
+    prev = 0
+    for tick, msg in events:
+        # só copia as mensagens cujo delta mudou (nada escreve nas mensagens depois desta etapa; o delta é sempre int >= 0)
+        delta = tick - prev
+        normalized.append(msg if msg.time == delta else msg.copy(skip_checks=True, time=delta))
+        prev = tick
+    normalized.append(MetaMessage("end_of_track", time=end - prev))
+    return normalized, track_name, collisions
+
+def normalize_midi(midi, memo=None):
+    # etapa final antes do save: em cada track ordem fixa no mesmo tick (eventos, note_off, note_on),
+    # um track_name no tick 0, um end_of_track no fim, sem notas duplicadas ou de duração zero;
+    # tracks na ordem do TRACK_ORDER (a primeira, de tempo, fica no lugar). O running status fica com o save.
+    # Na mesma passada, um MIDI com outra resolução é reescalado para GH2_TICKS_PER_BEAT.
+    # memo = {id(track): ...} compartilhado entre as variantes, para não normalizar a mesma track de novo
+    # retorna [Diagnostic] das notas que colidiram no rescale (ticks do arquivo reescalado, posições da origem)
+    with stage("normalize") as record:
+        if memo is None:
+            memo = {}
+        ticks_per_beat = midi.ticks_per_beat
+        if ticks_per_beat <= 0:
+            ticks_per_beat = GH2_TICKS_PER_BEAT # divisão SMPTE: não dá para reescalar
+        tempo_map = get_tempo_map(midi)
+        tracks = []
+        diagnostics = []
+        for i, track in enumerate(midi.tracks):
+            found = memo.get(id(track))
+            if found is None or found[0] is not track:
+                found = (track,) + _normalize_track(track, ticks_per_beat)
+                memo[id(track)] = found
+                record["read"] += _message_count(track)
+            normalized, name, collisions = found[1:]
+            diagnostics.extend(rescale_diagnostics(
+                [make_diagnostic(name, tick, f"note {note}", "warning",
+                                 f"[Rescale] Note {note} collides with the note_on before it after rescaling "
+                                 f"from {ticks_per_beat} to {GH2_TICKS_PER_BEAT} ticks per beat in {name}", tempo_map)
+                 for tick, note in collisions], ticks_per_beat))
+            tracks.append((0 if i == 0 else 1, TRACK_ORDER.get(name, len(TRACK_ORDER)), i, normalized))
+        tracks.sort(key=lambda t: t[:3])
+        midi.tracks = [t[3] for t in tracks]
+        build_track_index(midi)
+        if ticks_per_beat != GH2_TICKS_PER_BEAT:
+            log_step(f"Rescaled from {ticks_per_beat} to {GH2_TICKS_PER_BEAT} ticks per beat")
+            midi.ticks_per_beat = GH2_TICKS_PER_BEAT
+            if isinstance(midi, RawMidi):
+                midi.division = GH2_TICKS_PER_BEAT.to_bytes(2, "big")
+            midi.tempo_map = None # o mapa de tempo era dos ticks da origem
+    return diagnostics
 
 ####################################################################################################################################################
 
@@ -220,7 +1935,8 @@ def merge_tracks(midi, name_a, name_b, merged_name="MERGED"):
 # Perguntas para alterar a funcionalidade
 # --------------------------------------------
 
-if (auto == '0'):
+def ask_questions():
+    # pergunta as opções no prompt; só roda no __main__ (nunca no import, para os workers não travarem no input)
     print("@ ------------------------------------------------------------------- @")
     print("@  IF YOUR CHART IS LEAD/RHYTHM, DON'T FORGET THE GUITAR COOP CHART!  @")
     print("@             (you can copy and paste from guitar chart)              @")
@@ -239,6 +1955,606 @@ if (auto == '0'):
     print("Type 1 if SINGER, 2 if KEYS")
     metal = input("Please enter 1 or 2: ")
     print("")
+    return click, instrument, metal
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Conversão de um MIDI
+# --------------------------------------------
+
+def convert(midi, options=None, cache=None):
+    # aplica toda a conversão RB2 -> GH2 no MidiFile (in place); não imprime perguntas nem pede input
+    # cache = TrackCache para reaproveitar as tracks de saída cujas origens não mudaram
+    if options is None:
+        options = ConversionOptions()
+    convert_shared(midi, options, cache)
+    convert_variant(midi, options, cache)
+    return midi
+
+def convert_shared(midi, options=None, cache=None):
+    # parte da conversão que não depende de click/instrument/metal (feita uma vez para todas as variantes)
+    if options is None:
+        options = ConversionOptions()
+    engine = options.engine
+    # mapa de tempo lido antes de qualquer track mudar (posições dos avisos)
+    get_tempo_map(midi)
+
+    # --------------------------------------------
+    # Exemplos para construir scripts MIDI
+    # --------------------------------------------
+    '''
+    # Exemplo 1 Deletar Tracks
+    delete_track(midi, "TRACK NAME")
+
+    # Exemplo 2: Renomear track
+    rename_track_by_name(midi, "TRACK OLD NAME", "TRACK NEW NAME")
+
+    # Exemplo 3: Copiar apenas eventos de uma track para outra (sem copiar as notas)
+    copy_events_only(midi, "TRACK 1", "TRACK 2")
+
+    # Exemplo 4: Copiar apenas notas de uma track para outra (sem copiar eventos)
+    copy_notes_only(midi, "TRACK 1", "TRACK 2", note_map={96:36, 97:37})
+
+    # Exemplo 5: Mesclar tracks
+    merge_tracks(midi, "TRACK 1", "TRACK 2", merged_name="NEW TRACK")
+
+    # Exemplo 6: Montar uma track numa passada só (eventos da TRACK 1 + notas da TRACK 1 e TRACK 2)
+    build_track(midi, "NEW TRACK", [("TRACK 2", {96:36}, False), ("TRACK 1", {96:96}, True)], replace=["TRACK 1"])
+    '''
+
+####################################################################################################################################################
+
+    # -----------
+    # PART GUITAR
+    # -----------
+    # Eventos + notas do PART GUITAR, fretmap do PART GUITAR GHL e BIG-NOTE (laranja) do PART KEYS
+    convert_part(midi, "PART GUITAR", "PART GUITAR GHL", big_note_name="PART KEYS", cache=cache, engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # PART BASS
+    # -----------
+    # Eventos + notas do PART BASS e fretmap do PART BASS GHL
+    convert_part(midi, "PART BASS", "PART BASS GHL", cache=cache, engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # PART GUITAR COOP
+    # -----------
+    # Eventos + notas do PART GUITAR COOP e fretmap do PART GUITAR COOP GHL
+    convert_part(midi, "PART GUITAR COOP", "PART GUITAR COOP GHL", cache=cache, engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # PART RHYTHM
+    # -----------
+    # Eventos + notas do PART RHYTHM e fretmap do PART RHYTHM GHL
+    convert_part(midi, "PART RHYTHM", "PART RHYTHM GHL", cache=cache, engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # BAND BASS
+    # -----------
+    # Eventos + nota 96 do PART BASS (já convertido) para BAND BASS
+    build_track(midi, "BAND BASS", [("PART BASS", {96:36}, True)],
+                cache=cache, deps=["PART BASS", "PART BASS GHL"], engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # BAND DRUMS
+    # -----------
+    # Eventos + notas 96/100 do PART DRUMS para BAND DRUMS
+    build_track(midi, "BAND DRUMS", [("PART DRUMS", {96:36, 100:37}, True)], cache=cache, engine=engine)
+
+####################################################################################################################################################
+
+    # -----------
+    # EVENTS TRACK
+    # -----------
+    # Reescrever o EVENTS só com os eventos (formatação); o convert_variant põe ele depois da BAND SINGER/KEYS
+    midi.events_track = build_track(midi, "EVENTS", [("EVENTS", {}, True)], replace=["EVENTS"], cache=cache, engine=engine)
+    return midi
+
+def band_track_name(options):
+    return "BAND SINGER" if options.metal == "singer" else "BAND KEYS"
+
+def convert_variant(midi, options=None, cache=None):
+    # parte da conversão que muda com click/instrument/metal; roda depois do convert_shared
+    if options is None:
+        options = ConversionOptions()
+    engine = options.engine
+
+####################################################################################################################################################
+
+    # -----------
+    # BAND SINGER/KEYS
+    # -----------
+    # Copiar eventos do PART KEYS para BAND SINGER/KEYS
+    band_name = band_track_name(options)
+    cached_step(midi, cache.dir if cache else None, step_key(midi, cache, band_name, ["PART KEYS"], ["events"]),
+                band_name, lambda: copy_events_only(midi, "PART KEYS", band_name))
+
+    # EVENTS (já montado no convert_shared) vai para depois da BAND SINGER/KEYS
+    events = getattr(midi, "events_track", None)
+    if events is not None:
+        move_track_to_end(midi, events)
+
+####################################################################################################################################################
+
+    # -----------
+    # TRIGGERS TRACK
+    # -----------
+    if options.click: # Com drums no practice
+        # Notas de PART KEYS (keyframes) e PART DRUMS mescladas direto no TRIGGERS
+        build_track(midi, "TRIGGERS", [("PART KEYS", {96:48, 97:49, 98:50, 99:52}, False),
+                                       ("PART DRUMS", {96:24, 97:25, 98:26, 100:26}, False)], cache=cache, engine=engine)
+        # Deletar PART DRUMS
+        delete_track(midi, "PART DRUMS")
+        # Deletar PART KEYS
+        delete_track(midi, "PART KEYS")
+    else: # Sem drums no practice
+        # Copiar notas de PART KEYS para TRIGGERS
+        build_track(midi, "TRIGGERS", [("PART KEYS", {96:48, 97:49, 98:50, 99:52}, False)], cache=cache, engine=engine)
+        # Deletar PART DRUMS
+        delete_track(midi, "PART DRUMS")
+        # Deletar PART KEYS
+        delete_track(midi, "PART KEYS")
+
+####################################################################################################################################################
+
+    # Remoção de tracks por escolha
+    if options.instrument == "bass":
+        delete_track(midi, "PART GUITAR COOP")
+        delete_track(midi, "PART RHYTHM")
+    if options.instrument == "rhythm":
+        delete_track(midi, "PART BASS")
+    return midi
+
+####################################################################################################################################################
+
+def output_path_for(input_path, variant=None, output_dir=None, root=None):
+    # nome padrão do arquivo convertido: <nome>_gh2.mid ao lado da entrada (<nome>_<variante>_gh2.mid por variante)
+    # membros de zip vão para uma pasta com o nome do zip; com output_dir, o caminho relativo à root é espelhado lá
+    base = _mirrored_path(input_path, output_dir, root)
+    if variant is not None:
+        return f"{base}_{variant_name(variant)}_gh2.mid"
+    return f"{base}_gh2.mid"
+
+def save_variants(midi, targets, cache=None):
+    # targets = [(opções, arquivo de saída)]: as tracks comuns são convertidas uma vez e cada variante
+    # só faz o que muda (BAND SINGER/KEYS, TRIGGERS e as tracks apagadas); retorna os avisos de cada uma
+    convert_shared(midi, targets[0][0], cache)
+    results = []
+    memo = {}
+    for options, output_path in targets:
+        if len(targets) > 1:
+            variant = copy_midi(midi)
+            detach_track(variant, band_track_name(options or ConversionOptions()))
+        else:
+            variant = midi
+        convert_variant(variant, options, cache)
+        # Valida os eventos de texto antes de salvar
+        ticks_per_beat = variant.ticks_per_beat
+        warnings = validate_midi_events(variant, notes=False)
+        # Ordem, nomes, end_of_track, notas repetidas e resolução (o que antes precisava do re-export no REAPER)
+        # os avisos dos eventos passam para os ticks do arquivo salvo, como os das notas
+        warnings = rescale_diagnostics(warnings, ticks_per_beat) + normalize_midi(variant, memo)
+        # Notas checadas como vão ser salvas
+        warnings += check_midi_notes(variant, memo=memo)
+        for diagnostic in warnings:
+            print(diagnostic)
+        # Salvar arquivo processado (no pipeline, a thread de escrita grava os bytes)
+        with stage("save") as record:
+            write = current_writer()
+            if write is None:
+                folder = os.path.dirname(output_path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                variant.save(output_path)
+            else:
+                buffer = io.BytesIO()
+                variant.save(file=buffer)
+                write(output_path, buffer.getvalue())
+            record["emitted"] += sum(_message_count(track) for track in variant.tracks)
+        print(f"Saved as: {output_path}")
+        results.append(warnings)
+    return results
+
+def _convert_file_fast(input_path, targets, cache_dir=None):
+    # tenta o caminho rápido com o arquivo mapeado em memória (membros de zip são lidos para a memória)
+    # retorna (avisos de cada saída, log, None) ou (None, None, motivo) quando precisa do mido
+    if _prefetched(input_path) is not None or split_zip_member(input_path) is not None:
+        mm = read_input(input_path)
+    else:
+        with open(input_path, "rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                return None, None, str(e)
+    log = io.StringIO()
+    warnings = None
+    reason = None
+    try:
+        with contextlib.redirect_stdout(log):
+            warnings = convert_file_raw(memoryview(mm), targets, cache_dir)
+    except Exception as e:
+        reason = f"{type(e).__name__}: {e}" if not isinstance(e, RawUnsupported) else str(e)
+    try:
+        if isinstance(mm, mmap.mmap):
+            mm.close()
+    except BufferError:
+        pass # ainda tem memoryview viva; o mmap fecha quando ela for coletada
+    if reason is not None:
+        return None, None, reason
+    return warnings, log.getvalue(), None
+
+def convert_file(input_path, output_path=None, options=None, cache_dir=None):
+    # lê, converte, valida e salva um arquivo; retorna os avisos do validador (erros sobem como exceção)
+    # com cache_dir, as tracks de saída cujas origens não mudaram vêm do cache em disco
+    if output_path is None:
+        output_path = output_path_for(input_path)
+    return _convert_targets(input_path, [(options, output_path)], cache_dir)[0]
+
+def convert_file_variants(input_path, variants, options=None, cache_dir=None, output_dir=None, root=None):
+    # lê o arquivo uma vez e salva todas as variantes (<nome>_<variante>_gh2.mid)
+    # engine/fast_path vêm de options; retorna [(arquivo de saída, avisos)] na ordem de variants
+    if options is None:
+        options = ConversionOptions()
+    targets = [(variant._replace(engine=options.engine, fast_path=options.fast_path),
+                output_path_for(input_path, variant, output_dir, root))
+               for variant in variants]
+    warnings = _convert_targets(input_path, targets, cache_dir)
+    return [(output_path, w) for (variant, output_path), w in zip(targets, warnings)]
+
+def use_fast_path(options):
+    # o caminho rápido tem o próprio merge; engine="numpy" precisa das tracks do mido
+    return options is None or (options.fast_path and not (options.engine == "numpy" and np is not None))
+
+def _convert_targets(input_path, targets, cache_dir=None):
+    # caminho rápido se der, senão mido; targets = [(opções, arquivo de saída)]
+    options = targets[0][0]
+    metrics = current_metrics()
+    if use_fast_path(options):
+        mark = len(metrics.stages) if metrics is not None else 0
+        start = time.perf_counter()
+        warnings, log, reason = _convert_file_fast(input_path, targets, cache_dir)
+        if reason is None:
+            print(log, end="")
+            if metrics is not None:
+                metrics.path = "fast"
+            return warnings
+        if metrics is not None:
+            # as etapas do caminho rápido que não terminou viram uma só
+            del metrics.stages[mark:]
+            metrics.stages.append({"stage": "fast path (fallback)", "seconds": time.perf_counter() - start,
+                                   "read": 0, "emitted": 0})
+        print(f"Fast path not possible ({reason}), using mido.")
+    if metrics is not None:
+        metrics.path = "mido"
+    with stage("load") as record:
+        data = read_input(input_path)
+        midi = MidiFile(file=io.BytesIO(data))
+        record["bytes"] = len(data)
+        record["read"] += sum(len(track) for track in midi.tracks)
+    cache = None
+    if cache_dir is not None:
+        try:
+            cache = TrackCache(cache_dir, track_hashes(data))
+        except (ValueError, IndexError):
+            cache = None
+    return save_variants(midi, targets, cache)
+
+####################################################################################################################################################
+
+def process_file(input_path, options=None, output_path=None, cache_dir=None, profile_dir=None, verbose=False,
+                 variants=None, output_dir=None, root=None, measure_memory=False):
+    # converte um arquivo guardando o log e as métricas dele; erro num arquivo não derruba o batch
+    # profile_dir = pasta dos dumps do cProfile/tracemalloc (--profile)
+    # variants = lista de ConversionOptions; "output" vira a lista dos arquivos salvos
+    # output_dir/root = pasta de saída que espelha o caminho da entrada relativo à root (--output-dir)
+    # measure_memory = mede o pico de memória do arquivo com o tracemalloc (--report)
+    log = io.StringIO()
+    result = {"input": input_path, "output": None, "ok": False, "warnings": [], "log": "", "metrics": None}
+    with contextlib.redirect_stdout(log), collect_metrics(verbose) as metrics:
+        print(f"Processing: {input_path}")
+        start = time.perf_counter()
+        try:
+            with profiled(input_path, profile_dir, metrics, measure_memory):
+                if variants:
+                    saved = convert_file_variants(input_path, variants, options, cache_dir, output_dir, root)
+                    result["warnings"] = [d for output_path, warnings in saved for d in warnings]
+                    result["output"] = [output_path for output_path, warnings in saved]
+                else:
+                    if output_path is None:
+                        output_path = output_path_for(input_path, None, output_dir, root)
+                    result["warnings"] = convert_file(input_path, output_path, options, cache_dir)
+                    result["output"] = output_path
+            result["ok"] = True
+        except Exception as e:
+            print(f"[ERROR] {input_path}: {type(e).__name__}: {e}")
+        metrics.seconds = time.perf_counter() - start
+    result["log"] = log.getvalue()
+    result["metrics"] = metrics.as_dict()
+    return result
+
+####################################################################################################################################################
+
+def check_fast_path(midi_files, options=None):
+    # converte cada arquivo pelos dois caminhos e confere se a saída é idêntica byte a byte
+    if options is None:
+        options = ConversionOptions()
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        fast_path = os.path.join(tmp, "fast.mid")
+        mido_path = os.path.join(tmp, "mido.mid")
+        for input_path in midi_files:
+            with contextlib.redirect_stdout(io.StringIO()):
+                fast_warnings, log, reason = _convert_file_fast(input_path, [(options, fast_path)])
+                try:
+                    mido_warnings = convert_file(input_path, mido_path, options._replace(fast_path=False))
+                except Exception as e:
+                    mido_warnings = None
+                    mido_error = f"{type(e).__name__}: {e}"
+            if reason is not None:
+                print(f"[fallback] {input_path}: {reason}")
+            elif mido_warnings is None:
+                print(f"[DIFFERENT] {input_path}: fast path converted it, mido failed ({mido_error})")
+                ok = False
+            else:
+                with open(fast_path, "rb") as f1, open(mido_path, "rb") as f2:
+                    same = f1.read() == f2.read()
+                if same and fast_warnings[0] == mido_warnings:
+                    print(f"[same] {input_path}")
+                else:
+                    print(f"[DIFFERENT] {input_path}")
+                    ok = False
+    return ok
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Entradas: arquivos, pastas (recursivo) e .zip (sem extrair)
+# --------------------------------------------
+
+# um .mid dentro de um zip é endereçado como "pasta/pack.zip/songs/song.mid"
+
+def split_zip_member(input_path):
+    # "pasta/pack.zip/songs/a.mid" -> ("pasta/pack.zip", "songs/a.mid"); None se não for membro de zip
+    lower = input_path.lower()
+    start = 0
+    while True:
+        i = lower.find(".zip", start)
+        if i < 0:
+            return None
+        end = i + 4
+        if end < len(input_path) and input_path[end] in ("/", os.sep) and os.path.isfile(input_path[:end]):
+            return input_path[:end], input_path[end + 1:].replace(os.sep, "/")
+        start = end
+
+_open_zips = collections.OrderedDict() # caminho absoluto -> (mtime, ZipFile), o usado por último no fim
+_open_zips_lock = threading.Lock()
+
+@contextlib.contextmanager
+def open_zip(zip_path):
+    # um ZipFile aberto por zip, reaproveitado entre os membros (reaberto se o zip mudou no disco)
+    # o lock fica preso durante o uso, então um zip nunca é fechado enquanto outra thread lê dele
+    zip_path = os.path.abspath(zip_path)
+    mtime = os.path.getmtime(zip_path)
+    with _open_zips_lock:
+        entry = _open_zips.pop(zip_path, None)
+        if entry is not None and entry[0] != mtime:
+            entry[1].close()
+            entry = None
+        if entry is None:
+            entry = (mtime, zipfile.ZipFile(zip_path))
+        _open_zips[zip_path] = entry
+        while len(_open_zips) > ZIP_CACHE_SIZE:
+            _open_zips.popitem(last=False)[1][1].close()
+        yield entry[1]
+
+def close_zips():
+    # fecha todos os zips de entrada abertos (fim do run_batch)
+    with _open_zips_lock:
+        while _open_zips:
+            _open_zips.popitem()[1][1].close()
+
+_pipeline = threading.local()
+
+def _prefetched(input_path):
+    inputs = getattr(_pipeline, "inputs", None)
+    return inputs.get(input_path) if inputs else None
+
+def current_writer():
+    return getattr(_pipeline, "write", None)
+
+@contextlib.contextmanager
+def pipelined_io(inputs, write):
+    # usado pelo pipeline do run_batch (uma vez por arquivo, na thread de conversão):
+    # read_input devolve os bytes que a thread de leitura já trouxe ({arquivo: bytes}) e o save entrega
+    # write(arquivo de saída, bytes) para a thread de escrita em vez de gravar no disco
+    previous = (getattr(_pipeline, "inputs", None), current_writer())
+    _pipeline.inputs, _pipeline.write = inputs, write
+    try:
+        yield
+    finally:
+        _pipeline.inputs, _pipeline.write = previous
+
+def read_input(input_path):
+    # bytes do arquivo de entrada; membros de zip são lidos direto do zip, sem passar pelo disco
+    data = _prefetched(input_path)
+    if data is not None:
+        return data
+    zip_member = split_zip_member(input_path)
+    if zip_member is not None:
+        with open_zip(zip_member[0]) as archive:
+            return archive.read(zip_member[1])
+    with open(input_path, "rb") as f:
+        return f.read()
+
+def _is_midi_name(name):
+    lower = name.lower()
+    return lower.endswith(".mid") and not lower.endswith("_gh2.mid")
+
+def _zip_midi_files(zip_path):
+    try:
+        with open_zip(zip_path) as archive:
+            names = archive.namelist()
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Can't read {zip_path}: {e}")
+        return
+    for name in names:
+        parts = name.split("/")
+        # nomes com ".." ou absolutos não são espelhados para fora da pasta de saída
+        if _is_midi_name(name) and ".." not in parts and not name.startswith("/"):
+            yield f"{zip_path}/{name}"
+
+def iter_midi_files(root):
+    # percorre root sob demanda: os .mid da pasta e das subpastas e os .mid de dentro dos .zip (menos as saídas _gh2.mid)
+    # root também pode ser um .mid, um .zip ou um membro de zip
+    if os.path.isfile(root):
+        if root.lower().endswith(".zip"):
+            yield from _zip_midi_files(root)
+        else:
+            yield os.path.normpath(root)
+        return
+    if split_zip_member(root) is not None:
+        yield root
+        return
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d != TRACK_CACHE_DIR)
+        for name in sorted(files):
+            path = os.path.normpath(os.path.join(folder, name))
+            if _is_midi_name(name):
+                yield path
+            elif name.lower().endswith(".zip"):
+                yield from _zip_midi_files(path)
+
+def expand_inputs(paths):
+    # entradas da linha de comando -> (arquivo, pasta raiz) sob demanda; a raiz é o que o --output-dir espelha
+    for path in paths:
+        if os.path.isdir(path):
+            root = path
+        else:
+            zip_member = split_zip_member(path)
+            root = os.path.dirname(zip_member[0] if zip_member is not None else path)
+        for input_path in iter_midi_files(path):
+            yield input_path, root
+
+def _mirrored_path(input_path, output_dir=None, root=None):
+    # caminho da entrada sem extensão: membros de zip ficam numa pasta com o nome do zip (pack.zip/a.mid -> pack/a)
+    # com output_dir, o caminho relativo à root é repetido dentro de output_dir
+    zip_member = split_zip_member(input_path)
+    path = input_path
+    if zip_member is not None:
+        parts = [part for part in zip_member[1].split("/") if part not in ("", ".")]
+        path = os.path.join(os.path.splitext(zip_member[0])[0], *parts)
+    if output_dir is not None:
+        if root is None:
+            root = os.path.dirname(zip_member[0] if zip_member is not None else input_path)
+        path = os.path.join(output_dir, os.path.relpath(path, root or "."))
+    return os.path.splitext(path)[0]
+
+class OutputZip:
+    # --output-zip: os workers salvam numa pasta temporária e cada saída entra no zip quando o arquivo termina
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self.staging = tempfile.mkdtemp(prefix="msTOgh2_")
+        self.zip = zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED)
+
+    def store(self, result):
+        # move as saídas do resultado para o zip; "output" passa a apontar para dentro do zip
+        outputs = result["output"] if isinstance(result["output"], list) else [result["output"]]
+        stored = []
+        for path in outputs:
+            if path is None:
+                continue
+            name = os.path.relpath(path, self.staging).replace(os.sep, "/")
+            self.zip.write(path, name)
+            os.remove(path)
+            stored.append(f"{self.zip_path}/{name}")
+        result["output"] = stored if isinstance(result["output"], list) else (stored[0] if stored else None)
+        result["log"] = result["log"].replace(os.path.join(self.staging, ""), f"{self.zip_path}/")
+
+    def close(self):
+        self.zip.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Manifest (modo incremental)
+# --------------------------------------------
+
+def file_hash(path):
+    # sha256 do conteúdo do arquivo (ou do membro de zip)
+    h = hashlib.sha256()
+    if split_zip_member(path) is not None:
+        h.update(read_input(path))
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(manifest_path):
+    # manifest ausente ou corrompido = tudo é reconvertido
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("files"), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"files": {}}
+
+def save_manifest(manifest_path, manifest):
+    # grava num temporário e troca, para não deixar manifest pela metade
+    folder = os.path.dirname(manifest_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def _manifest_entry(input_hash, options, output_path, variants=None):
+    # com variants, output_path é a lista de arquivos das variantes (as opções de click/instrument/metal não contam)
+    entry = {"hash": input_hash,
+             "converter": CONVERTER_VERSION,
+             "output": output_path}
+    if variants:
+        entry["variants"] = [variant_name(variant) for variant in variants]
+    else:
+        entry["options"] = {name: getattr(options, name) for name in OUTPUT_OPTIONS}
+    return entry
+
+def is_up_to_date(entry, input_hash, options, output_path, variants=None):
+    # mesma entrada, mesma versão, mesmas opções e as saídas ainda existem
+    outputs = output_path if isinstance(output_path, list) else [output_path]
+    return (entry is not None
+            and entry == _manifest_entry(input_hash, options, output_path, variants)
+            and all(os.path.exists(path) for path in outputs))
+
+def data_folder(input_path, root=None, output_dir=None):
+    # pasta do manifest e do cache de uma entrada: a do --output-dir, senão a raiz (ou a pasta) da entrada
+    if output_dir:
+        return output_dir
+    if root is None:
+        zip_member = split_zip_member(input_path)
+        root = os.path.dirname(zip_member[0] if zip_member is not None else input_path)
+    return root or "."
+
+def expected_outputs(input_path, variants=None, output_dir=None, root=None):
+    # arquivo(s) que a conversão de input_path gera
+    if variants:
+        return [output_path_for(input_path, variant, output_dir, root) for variant in variants]
+    return output_path_for(input_path, None, output_dir, root)
 
 ####################################################################################################################################################
 
@@ -246,256 +2562,484 @@ if (auto == '0'):
 # Processamento em batch
 # --------------------------------------------
 
-if __name__ == "__main__":
-    midi_files = [f for f in glob.glob("*.mid") if not f.endswith("_gh2.mid")]
+def run_pipeline(items, convert, finished, skip=None, fail_fast=False):
+    # batch em três estágios: thread de leitura -> conversão (esta thread) -> thread de escrita
+    # as filas limitadas (PIPELINE_READ_AHEAD arquivos lidos, PIPELINE_WRITE_BEHIND por gravar) limitam a memória
+    # items = (arquivo, raiz); skip(arquivo, raiz, bytes) roda na thread de leitura e True pula o arquivo (manifest)
+    # convert(arquivo, raiz, bytes, write) -> resultado; finished(resultado) roda nesta thread depois que as saídas
+    # do arquivo foram gravadas. Retorna quantos arquivos ficaram sem converter porque o fail_fast parou o batch.
+    read_queue = queue.Queue(maxsize=PIPELINE_READ_AHEAD)
+    write_queue = queue.Queue(maxsize=PIPELINE_WRITE_BEHIND)
+    written = queue.Queue()
+    stop = threading.Event()
+    not_read = [0]
+
+    def reader():
+        try:
+            for input_path, root in items:
+                if stop.is_set():
+                    not_read[0] += 1 # só conta o que falta
+                    continue
+                try:
+                    data = read_input(input_path)
+                except Exception:
+                    data = None # a conversão tenta ler de novo e mostra o erro no log do arquivo
+                if data is not None and skip is not None and skip(input_path, root, data):
+                    continue
+                read_queue.put((input_path, root, data))
+        finally:
+            read_queue.put(None)
+
+    def writer():
+        while True:
+            job = write_queue.get()
+            if job is None:
+                break
+            result, outputs = job
+            start = time.perf_counter()
+            size = 0
+            for output_path, data in outputs:
+                try:
+                    folder = os.path.dirname(output_path)
+                    if folder:
+                        os.makedirs(folder, exist_ok=True)
+                    with open(output_path, "wb") as f:
+                        f.write(data)
+                    size += len(data)
+                except OSError as e:
+                    result["ok"] = False
+                    result["log"] += f"[ERROR] {output_path}: {type(e).__name__}: {e}\n"
+            if result["metrics"] is not None:
+                result["metrics"]["stages"].append({"stage": "write", "seconds": time.perf_counter() - start,
+                                                    "read": 0, "emitted": 0, "bytes": size})
+            written.put(result)
+
+    def flush():
+        while True:
+            try:
+                result = written.get_nowait()
+            except queue.Empty:
+                return
+            finished(result)
+            if fail_fast and has_failed(result):
+                stop.set()
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+    exhausted = False
+    dropped = 0
+    try:
+        while not stop.is_set():
+            job = read_queue.get()
+            if job is None:
+                exhausted = True
+                break
+            input_path, root, data = job
+            outputs = []
+            result = convert(input_path, root, data, lambda output_path, output: outputs.append((output_path, output)))
+            del job, data
+            write_queue.put((result, outputs))
+            if fail_fast and has_failed(result):
+                stop.set()
+            flush()
+    finally:
+        stop.set()
+        # libera a thread de leitura (que pode estar esperando espaço na fila) e espera as gravações pendentes
+        while not exhausted:
+            exhausted = read_queue.get() is None
+            dropped += not exhausted
+        write_queue.put(None)
+        for thread in threads:
+            thread.join()
+        flush()
+    return dropped + not_read[0]
+
+def run_batch(midi_files, options=None, jobs=1, manifest_path=None, force=False, cache_dir=None,
+              profile_dir=None, verbose=False, fail_fast=False, variants=None, output_dir=None, output_zip=None,
+              measure_memory=False, manifest_name=None):
+    # converte os arquivos em sequência ou num pool de processos (jobs > 1)
+    # o log de cada arquivo é impresso em bloco quando ele termina
+    # com manifest_path, arquivos que não mudaram desde a última conversão são pulados
+    # com manifest_name, o mesmo com um manifest por pasta de saída (data_folder: output_dir ou a raiz da entrada)
+    # com cache_dir, dentro de cada arquivo só as tracks que mudaram são reconvertidas (e no fim o cache é podado)
+    # com fail_fast, para no primeiro arquivo com erro ou aviso crítico (os que faltam não são convertidos)
+    # com variants, cada arquivo é lido uma vez e salvo em todas as variantes
+    # midi_files = caminhos ou (caminho, pasta raiz), ex. do expand_inputs; pode ser um gerador
+    # com output_dir, as saídas vão para lá espelhando o caminho relativo à raiz; com output_zip, para dentro do zip
+    # (o zip é sempre gravado do zero, então o manifest não é usado)
+    # com measure_memory, cada arquivo guarda o seu pico de memória (tracemalloc) nas métricas
+    if options is None:
+        options = ConversionOptions()
+    archive = None
+    if output_zip is not None:
+        archive = OutputZip(output_zip)
+        output_dir = archive.staging
+        manifest_path = manifest_name = None
+    use_manifest = bool(manifest_path or manifest_name)
+    manifests = {} # arquivo do manifest -> conteúdo
+    locations = {} # entrada -> arquivo do manifest
+    items = ((item if isinstance(item, tuple) else (item, None)) for item in midi_files)
+    hashes = {}
+    skipped = []
+    results = []
+
+    def manifest_for(input_path, root):
+        path = manifest_path or os.path.join(data_folder(input_path, root, output_dir), manifest_name)
+        if path not in manifests:
+            manifests[path] = load_manifest(path)
+        locations[input_path] = path
+        return manifests[path]
+
+    def up_to_date(input_path, root, input_hash):
+        # manifest: mesma entrada, versão e opções, e as saídas ainda existem
+        hashes[input_path] = input_hash
+        entry = manifest_for(input_path, root)["files"].get(os.path.abspath(input_path))
+        if not force and is_up_to_date(entry, input_hash, options, expected_outputs(input_path, variants, output_dir, root),
+                                       variants):
+            skipped.append(input_path)
+            return True
+        return False
+
+    def finished(result):
+        if archive is not None and result["ok"]:
+            archive.store(result)
+        print(result["log"])
+        results.append(result)
+
+    def convert(input_path, root, data, write):
+        with pipelined_io({input_path: data} if data is not None else {}, write):
+            return process_file(input_path, options, None, cache_dir, profile_dir, verbose, variants, output_dir, root,
+                                measure_memory)
+
+    stopped = 0 # arquivos não convertidos por causa do fail_fast
+    try:
+        if jobs == 1:
+            # leitura, conversão e escrita sobrepostas; o hash do manifest sai dos bytes já lidos
+            skip = (lambda input_path, root, data: up_to_date(input_path, root, hashlib.sha256(data).hexdigest())) \
+                if use_manifest else None
+            stopped = run_pipeline(items, convert, finished, skip, fail_fast)
+        else:
+            pending = []
+            roots = {}
+            for input_path, root in items:
+                roots[input_path] = root
+                if use_manifest:
+                    manifest_for(input_path, root)
+                    try:
+                        input_hash = file_hash(input_path)
+                    except OSError:
+                        input_hash = None
+                    if input_hash is not None and up_to_date(input_path, root, input_hash):
+                        continue
+                pending.append(input_path)
+            if len(pending) <= 1:
+                for input_path in pending:
+                    finished(convert(input_path, roots[input_path], None, None))
+            else:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+                    futures = [pool.submit(process_file, input_path, options, None, cache_dir, profile_dir, verbose,
+                                           variants, output_dir, roots[input_path], measure_memory)
+                               for input_path in pending]
+                    done = set()
+                    for future in concurrent.futures.as_completed(futures):
+                        done.add(future)
+                        finished(future.result())
+                        if fail_fast and has_failed(results[-1]):
+                            # só os que ainda não começaram são cancelados
+                            stopped = sum(1 for f in futures if f.cancel())
+                            break
+                # os que já estavam rodando terminam ao sair do with (e gravam a saída), então entram no log e no manifest
+                for future in futures:
+                    if future not in done and not future.cancelled():
+                        finished(future.result())
+    finally:
+        if archive is not None:
+            archive.close()
+        close_zips()
+    if cache_dir is not None:
+        prune_track_cache(cache_dir)
+
+    for r in results:
+        path = locations.get(r["input"])
+        if path is None:
+            continue
+        key = os.path.abspath(r["input"])
+        if r["ok"] and r["input"] in hashes:
+            manifests[path]["files"][key] = _manifest_entry(hashes[r["input"]], options, r["output"], variants)
+        else:
+            manifests[path]["files"].pop(key, None)
+    for path, manifest in manifests.items():
+        save_manifest(path, manifest)
+
+    ok = sum(1 for r in results if r["ok"])
+    failed = [r["input"] for r in results if not r["ok"]]
+    warnings = sum(len(r["warnings"]) for r in results)
+    print(f"Done: {ok} converted, {len(skipped)} unchanged (skipped), {len(failed)} failed, {warnings} validator warnings")
+    for input_path in failed:
+        print(f"  failed: {input_path}")
+    if stopped:
+        print(f"Stopped early (--fail-fast): {stopped} file(s) not converted")
+    summary = metrics_summary(results)
+    if summary:
+        print(summary)
+    return results
+
+def has_failed(result):
+    # erro na conversão ou aviso crítico do validador (usado pelo --fail-fast)
+    return not result["ok"] or any(d.severity == "critical" for d in result["warnings"])
+
+####################################################################################################################################################
+
+def scan_midi_files(folder):
+    # {arquivo: (mtime, tamanho)} dos .mid da pasta e das subpastas (menos as saídas _gh2.mid)
+    found = {}
+    for dirpath, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if d != TRACK_CACHE_DIR]
+        for name in files:
+            if _is_midi_name(name):
+                path = os.path.normpath(os.path.join(dirpath, name))
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue # apagado entre o walk e o stat
+                found[path] = (info.st_mtime_ns, info.st_size)
+    return found
+
+def watch(folder, options=None, manifest_path=None, cache_dir=None, verbose=False, variants=None, output_dir=None,
+          interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
+    # --watch: fica rodando no mesmo processo (mido, tabelas e cache já carregados) e reconverte cada .mid
+    # novo ou salvo de novo na pasta; o arquivo só é convertido depois de ficar `debounce` segundos sem mudar
+    # (o Moonscraper pode estar no meio da escrita). O que muda durante uma conversão é juntado:
+    # cada arquivo é convertido uma vez só, com o conteúdo mais novo. Para com Ctrl+C.
+    known = scan_midi_files(folder)
+    # primeiro os arquivos que mudaram desde a última vez (o manifest pula o resto)
+    run_batch([(path, folder) for path in sorted(known)], options, manifest_path=manifest_path, cache_dir=cache_dir,
+              verbose=verbose, variants=variants, output_dir=output_dir)
+    print(f"Watching {folder} for changes (Ctrl+C to stop)...")
+    changed = {} # arquivo -> (mtime e tamanho, quando mudou por último)
+    try:
+        while True:
+            time.sleep(interval)
+            current = scan_midi_files(folder)
+            now = time.monotonic()
+            for path in list(known):
+                if path not in current:
+                    del known[path]
+            for path in list(changed):
+                if path not in current:
+                    del changed[path]
+            for path, signature in current.items():
+                if known.get(path) == signature:
+                    changed.pop(path, None)
+                elif path not in changed or changed[path][0] != signature:
+                    changed[path] = (signature, now)
+            ready = sorted(path for path, (signature, seen) in changed.items() if now - seen >= debounce)
+            if ready:
+                for path in ready:
+                    known[path] = changed.pop(path)[0]
+                run_batch([(path, folder) for path in ready], options, manifest_path=manifest_path,
+                          cache_dir=cache_dir, verbose=verbose, variants=variants, output_dir=output_dir)
+                print(f"Watching {folder} for changes (Ctrl+C to stop)...")
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+####################################################################################################################################################
 
-    if not midi_files:
+# --------------------------------------------
+# Relatório de métricas
+# --------------------------------------------
+
+def metrics_summary(results):
+    # uma linha: tempo total, arquivo mais lento e as etapas que mais pesaram
+    timed = [r for r in results if r.get("metrics") and r["metrics"]["seconds"] is not None]
+    if not timed:
+        return ""
+    total = sum(r["metrics"]["seconds"] for r in timed)
+    slowest = max(timed, key=lambda r: r["metrics"]["seconds"])
+    stages = collections.Counter()
+    for r in timed:
+        for s in r["metrics"]["stages"]:
+            stages[s["stage"]] += s["seconds"]
+    top = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages.most_common(3))
+    summary = (f"Time: {total:.2f}s converting; slowest file: {slowest['input']} ({slowest['metrics']['seconds']:.2f}s); "
+               f"slowest stages: {top}")
+    max_rss = _max_rss()
+    if max_rss is not None:
+        summary += f"; max memory: {max_rss / 2**20:.1f} MB"
+    return summary
+
+REPORT_COLUMNS = ["input", "output", "ok", "path", "warnings", "critical", "seconds", "peak_memory",
+                  "stage", "stage_seconds", "read", "emitted", "bytes", "cached"]
+
+def write_report(report_path, results):
+    # relatório por arquivo: .csv = uma linha por etapa; qualquer outra extensão = JSON
+    # peak_memory é o pico do arquivo (tracemalloc); a memória máxima do processo (max_rss) é uma só por execução,
+    # então vai no topo do JSON e na linha de resumo, não em cada arquivo
+    files = []
+    for r in results:
+        metrics = r.get("metrics") or {}
+        files.append({"input": r["input"], "output": r["output"], "ok": r["ok"], "warnings": len(r["warnings"]),
+                      "critical": sum(1 for d in r["warnings"] if d.severity == "critical"),
+                      "path": metrics.get("path"), "seconds": metrics.get("seconds"),
+                      "peak_memory": metrics.get("peak_memory"), "stages": metrics.get("stages", [])})
+    if report_path.lower().endswith(".csv"):
+        with open(report_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_COLUMNS)
+            for entry in files:
+                for s in entry["stages"] or [{}]:
+                    row = dict(entry, stage=s.get("stage"), stage_seconds=s.get("seconds"), read=s.get("read"),
+                               emitted=s.get("emitted"), bytes=s.get("bytes"), cached=s.get("cached", False))
+                    writer.writerow([row[column] for column in REPORT_COLUMNS])
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"converter": CONVERTER_VERSION, "max_rss": _max_rss(), "files": files}, f, indent=1)
+
+####################################################################################################################################################
+
+def find_midi_files(folder="."):
+    # todos os .mid da pasta, menos os que já são saída (_gh2.mid)
+    return [os.path.normpath(f) for f in glob.glob(os.path.join(folder, "*.mid")) if not f.endswith("_gh2.mid")]
+
+def build_parser():
+    defaults = options_from_answers(click, instrument, metal)
+    parser = argparse.ArgumentParser(description="Convert Moonscraper RB2 MIDI exports to GH2.")
+    parser.add_argument("inputs", nargs="*",
+                        help="MIDI files, folders (searched recursively) or .zip packs to convert "
+                             "(default: every .mid in the current folder)")
+    parser.add_argument("-o", "--output",
+                        help="output file (only with a single input; default: <name>_gh2.mid)")
+    parser.add_argument("--output-dir", metavar="DIR",
+                        help="save the converted files in DIR, with the same subfolders as the input")
+    parser.add_argument("--output-zip", metavar="FILE",
+                        help="save the converted files inside a new zip FILE, with the same subfolders as the input")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of files converted in parallel (0 = one per CPU core)")
+    parser.add_argument("--click", dest="click", action="store_true", default=defaults.click,
+                        help="drums click in practice mode")
+    parser.add_argument("--no-click", dest="click", action="store_false",
+                        help="no drums click in practice mode")
+    parser.add_argument("--instrument", choices=["bass", "rhythm"], default=defaults.instrument,
+                        help="GUITAR/BASS chart (bass) or LEAD/RHYTHM chart (rhythm)")
+    parser.add_argument("--metal", choices=["singer", "keys"], default=defaults.metal,
+                        help="BAND SINGER (singer) or BAND KEYS (keys)")
+    parser.add_argument("--variant", action="append", metavar="NAME",
+                        help="write this variant too, as <name>_<variant>_gh2.mid (click|noclick _ bass|rhythm _ "
+                             "singer|keys, e.g. noclick_bass_singer; 'all' = the 8 variants). Can be repeated; "
+                             "each file is read and converted once for all variants")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python",
+                        help="conversion engine; numpy is faster on dense charts (needs: pip install numpy)")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="always read and write through mido (skip the raw byte fast path)")
+    parser.add_argument("--check-fast-path", action="store_true",
+                        help="convert the inputs through both paths and check that the outputs are identical")
+    parser.add_argument("--force", action="store_true",
+                        help="reconvert every file, even the ones the manifest says are up to date")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help=f"don't read or write {MANIFEST_NAME} (always reconvert)")
+    parser.add_argument("--no-track-cache", action="store_true",
+                        help=f"don't reuse converted tracks from {TRACK_CACHE_DIR}")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop at the first file that fails or has a CRITICAL validator warning (exit code 1)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print every step (tracks copied, merged, deleted...) for each file")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write per-file and per-stage timings and peak memory to FILE (.csv or .json)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="write a cProfile dump and a tracemalloc memory report per file to DIR")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="keep running and convert every .mid saved in DIR (and its subfolders) as soon as it changes")
+    parser.add_argument("-i", "--interactive", action="store_true",
+                        help="ask the questions in the prompt and wait for Enter at the end")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    interactive = args.interactive or auto == '0'
+
+    if args.engine == "numpy" and np is None:
+        print("numpy not installed, using the python engine.")
+    options = ConversionOptions(click=args.click, instrument=args.instrument, metal=args.metal,
+                                engine=args.engine, fast_path=not args.no_fast_path)
+    variants = None
+    if args.variant:
+        try:
+            variants = parse_variants(args.variant)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.output:
+            parser.error("--output can't be used with --variant")
+    if interactive and not variants:
+        options = options_from_answers(*ask_questions())._replace(engine=args.engine, fast_path=not args.no_fast_path)
+
+    if args.output and (args.output_dir or args.output_zip):
+        parser.error("--output can't be used with --output-dir or --output-zip")
+    if args.output_dir and args.output_zip:
+        parser.error("use only one of --output-dir and --output-zip")
+    if args.watch and (args.inputs or args.output or args.output_zip or args.check_fast_path):
+        parser.error("--watch can't be used with input files, --output, --output-zip or --check-fast-path")
+    if args.watch and not os.path.isdir(args.watch):
+        parser.error(f"--watch: folder not found: {args.watch}")
+    if args.watch:
+        # manifest e cache junto das saídas (output_dir ou a pasta vigiada), não na pasta em que o script roda
+        folder = args.output_dir or args.watch
+        watch(args.watch, options, None if args.no_manifest else os.path.join(folder, MANIFEST_NAME),
+              None if args.no_track_cache else os.path.join(folder, TRACK_CACHE_DIR), args.verbose, variants,
+              args.output_dir)
+        return 0
+    # pastas e zips são percorridos sob demanda, enquanto os arquivos são convertidos
+    midi_files = expand_inputs(args.inputs) if args.inputs else find_midi_files()
+    first = next(iter(midi_files), None)
+    if first is not None and args.inputs:
+        midi_files = itertools.chain([first], midi_files)
+    # o cache fica junto das saídas: --output-dir, pasta do --output/--output-zip ou raiz da primeira entrada
+    if args.output or args.output_zip:
+        folder = os.path.dirname(args.output or args.output_zip) or "."
+    elif first is not None:
+        folder = data_folder(*(first if isinstance(first, tuple) else (first, None)), args.output_dir)
+    else:
+        folder = "."
+    cache_dir = None if args.no_track_cache else os.path.join(folder, TRACK_CACHE_DIR)
+    if args.output or args.check_fast_path:
+        midi_files = [item[0] if isinstance(item, tuple) else item for item in midi_files]
+    if args.output and len(midi_files) != 1:
+        parser.error("--output needs exactly one input file")
+
+    if args.check_fast_path:
+        return 0 if check_fast_path(midi_files, options) else 1
+    if first is None:
         print("No MIDI Files Found in This Folder.")
+        results = []
+    elif args.output:
+        result = process_file(midi_files[0], options, args.output, cache_dir, args.profile, args.verbose,
+                              measure_memory=bool(args.report))
+        print(result["log"])
+        results = [result]
+        if cache_dir is not None:
+            prune_track_cache(cache_dir)
     else:
-        for input_path in midi_files:
-            print(f"Processing: {input_path}")
-            midi = MidiFile(input_path)
-
-####################################################################################################################################################
-
-            # --------------------------------------------
-            # Exemplos para construir scripts MIDI
-            # --------------------------------------------
-            '''
-            # Exemplo 1 Deletar Tracks
-            delete_track(midi, "TRACK NAME")
-
-            # Exemplo 2: Renomear track
-            rename_track_by_name(midi, "TRACK OLD NAME", "TRACK NEW NAME")
-
-            # Exemplo 3: Copiar apenas eventos de uma track para outra (sem copiar as notas)
-            copy_events_only(midi, "TRACK 1", "TRACK 2")
-
-            # Exemplo 4: Copiar apenas notas de uma track para outra (sem copiar eventos)
-            copy_notes_only(midi, "TRACK 1", "TRACK 2", note_map={96:36, 97:37})
-
-            # Exemplo 5: Mesclar tracks
-            merge_tracks(midi, "TRACK 1", "TRACK 2", merged_name="NEW TRACK")
-            '''
-
-####################################################################################################################################################
-
-            # -----------
-            # PART GUITAR
-            # -----------
-            # Copiar eventos do PART GUITAR para PART GUITAR EVENTS
-            copy_events_only(midi, "PART GUITAR", "PART GUITAR EVENTS")
-            
-            # Copiar notas de PART GUITAR para PART GUITAR NOTES
-            copy_notes_only(midi, "PART GUITAR", "PART GUITAR NOTES", note_map= instrument_notes)
-            
-            # Copiar a nota BIG-NOTE (laranja) do PART KEYS para BIG-NOTE e depois PART GUITAR NOTES
-            copy_notes_only(midi, "PART KEYS", "BIG-NOTE", note_map={100:110})
-            rename_track_by_name(midi, "PART GUITAR NOTES", "PART GUITAR TEMP")
-            merge_tracks(midi, "BIG-NOTE", "PART GUITAR TEMP", merged_name="PART GUITAR NOTES")
-            delete_track(midi, "PART GUITAR TEMP")
-            delete_track(midi, "BIG-NOTE")
-            
-            # Copiar notas do PART GUITAR GHL para PART GUITAR NOTES
-            copy_notes_only(midi, "PART GUITAR GHL", "GTR FRETMAP", note_map= fretmapping_notes)
-            rename_track_by_name(midi, "PART GUITAR NOTES", "PART GUITAR TEMP")
-            merge_tracks(midi, "GTR FRETMAP", "PART GUITAR TEMP", merged_name="PART GUITAR NOTES")
-            delete_track(midi, "PART GUITAR TEMP")
-            delete_track(midi, "GTR FRETMAP")
-            delete_track(midi, "PART GUITAR GHL")
-            
-            # Deletar o PART GUITAR
-            delete_track(midi, "PART GUITAR")
-            # Mesclar os PART GUITAR temporários
-            merge_tracks(midi, "PART GUITAR EVENTS", "PART GUITAR NOTES", merged_name="PART GUITAR")
-            # Deletar os PART GUITAR temporários
-            delete_track(midi, "PART GUITAR EVENTS")
-            delete_track(midi, "PART GUITAR NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # PART BASS
-            # -----------
-            # Copiar eventos do PART BASS para PART BASS EVENTS
-            copy_events_only(midi, "PART BASS", "PART BASS EVENTS")
-            
-            # Copiar notas de PART BASS para PART BASS NOTES
-            copy_notes_only(midi, "PART BASS", "PART BASS NOTES", note_map= instrument_notes)
-            
-            # Copiar notas do PART BASS GHL para PART BASS NOTES
-            copy_notes_only(midi, "PART BASS GHL", "BASS FRETMAP", note_map= fretmapping_notes)
-            rename_track_by_name(midi, "PART BASS NOTES", "PART BASS TEMP")
-            merge_tracks(midi, "BASS FRETMAP", "PART BASS TEMP", merged_name="PART BASS NOTES")
-            delete_track(midi, "PART BASS TEMP")
-            delete_track(midi, "BASS FRETMAP")
-            delete_track(midi, "PART BASS GHL")
-            
-            # Deletar o PART BASS
-            delete_track(midi, "PART BASS")
-            # Mesclar os PART BASS temporários
-            merge_tracks(midi, "PART BASS EVENTS", "PART BASS NOTES", merged_name="PART BASS")
-            # Deletar os PART BASS temporários
-            delete_track(midi, "PART BASS EVENTS")
-            delete_track(midi, "PART BASS NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # PART GUITAR COOP
-            # -----------
-            # Copiar eventos do PART GUITAR COOP para PART GUITAR COOP EVENTS
-            copy_events_only(midi, "PART GUITAR COOP", "PART GUITAR COOP EVENTS")
-            
-            # Copiar notas de PART GUITAR COOP para PART GUITAR COOP NOTES
-            copy_notes_only(midi, "PART GUITAR COOP", "PART GUITAR COOP NOTES", note_map= instrument_notes)
-            
-            # Copiar notas do PART GUITAR COOP GHL para PART GUITAR COOP NOTES
-            copy_notes_only(midi, "PART GUITAR COOP GHL", "COOP FRETMAP", note_map= fretmapping_notes)
-            rename_track_by_name(midi, "PART GUITAR COOP NOTES", "PART GUITAR COOP TEMP")
-            merge_tracks(midi, "COOP FRETMAP", "PART GUITAR COOP TEMP", merged_name="PART GUITAR COOP NOTES")
-            delete_track(midi, "PART GUITAR COOP TEMP")
-            delete_track(midi, "COOP FRETMAP")
-            delete_track(midi, "PART GUITAR COOP GHL")
-            
-            # Deletar o PART GUITAR COOP
-            delete_track(midi, "PART GUITAR COOP")
-            # Mesclar os PART GUITAR COOP temporários
-            merge_tracks(midi, "PART GUITAR COOP EVENTS", "PART GUITAR COOP NOTES", merged_name="PART GUITAR COOP")
-            # Deletar os PART GUITAR COOP temporários
-            delete_track(midi, "PART GUITAR COOP EVENTS")
-            delete_track(midi, "PART GUITAR COOP NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # PART RHYTHM
-            # -----------
-            # Copiar eventos do PART RHYTHM para PART RHYTHM EVENTS
-            copy_events_only(midi, "PART RHYTHM", "PART RHYTHM EVENTS")
-            
-            # Copiar notas de PART RHYTHM para PART RHYTHM NOTES
-            copy_notes_only(midi, "PART RHYTHM", "PART RHYTHM NOTES", note_map= instrument_notes)
-            
-            # Copiar notas do PART RHYTHM GHL para PART RHYTHM NOTES
-            copy_notes_only(midi, "PART RHYTHM GHL", "RHYTHM FRETMAP", note_map= fretmapping_notes)
-            rename_track_by_name(midi, "PART RHYTHM NOTES", "PART RHYTHM TEMP")
-            merge_tracks(midi, "RHYTHM FRETMAP", "PART RHYTHM TEMP", merged_name="PART RHYTHM NOTES")
-            delete_track(midi, "PART RHYTHM TEMP")
-            delete_track(midi, "RHYTHM FRETMAP")
-            delete_track(midi, "PART RHYTHM GHL")
-            
-            # Deletar o PART RHYTHM
-            delete_track(midi, "PART RHYTHM")
-            # Mesclar os PART RHYTHM temporários
-            merge_tracks(midi, "PART RHYTHM EVENTS", "PART RHYTHM NOTES", merged_name="PART RHYTHM")
-            # Deletar os PART RHYTHM temporários
-            delete_track(midi, "PART RHYTHM EVENTS")
-            delete_track(midi, "PART RHYTHM NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # BAND BASS
-            # -----------
-            # Copiar eventos do PART BASS para BAND BASS EVENTS
-            copy_events_only(midi, "PART BASS", "BAND BASS EVENTS")
-            # Copiar notas de PART BASS para BAND BASS NOTES
-            copy_notes_only(midi, "PART BASS", "BAND BASS NOTES", note_map={96:36})
-            # Mesclar os BAND BASS temporários
-            merge_tracks(midi, "BAND BASS EVENTS", "BAND BASS NOTES", merged_name="BAND BASS")
-            # Deletar os BAND BASS temporários
-            delete_track(midi, "BAND BASS EVENTS")
-            delete_track(midi, "BAND BASS NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # BAND DRUMS
-            # -----------
-            # Copiar eventos do PART DRUMS para BAND DRUMS EVENTS
-            copy_events_only(midi, "PART DRUMS", "BAND DRUMS EVENTS")
-            # Copiar notas de PART DRUMS para BAND DRUMS NOTES
-            copy_notes_only(midi, "PART DRUMS", "BAND DRUMS NOTES", note_map={96:36, 100:37})
-            # Mesclar os BAND DRUMS temporários
-            merge_tracks(midi, "BAND DRUMS EVENTS", "BAND DRUMS NOTES", merged_name="BAND DRUMS")
-            # Deletar os BAND DRUMS temporários
-            delete_track(midi, "BAND DRUMS EVENTS")
-            delete_track(midi, "BAND DRUMS NOTES")
-
-####################################################################################################################################################
-
-            # -----------
-            # BAND SINGER/KEYS
-            # -----------
-            # Copiar eventos do PART KEYS para BAND SINGER/KEYS
-            if (metal == '1'): # Se for BAND SINGER
-                copy_events_only(midi, "PART KEYS", "BAND SINGER")
-            if (metal == '2'): # se for BAND KEYS
-                copy_events_only(midi, "PART KEYS", "BAND KEYS")
-
-####################################################################################################################################################
-
-            # -----------
-            # EVENTS TRACK
-            # -----------
-            # Copiar eventos do EVENTS para EVENTS (formatação)
-            copy_events_only(midi, "EVENTS", "EVENTS FORMAT")
-            delete_track(midi, "EVENTS")
-            rename_track_by_name(midi, "EVENTS FORMAT", "EVENTS")
-
-####################################################################################################################################################
-
-            # -----------
-            # TRIGGERS TRACK
-            # -----------
-            if (click == '1'): # Com drums no practice
-                # Copiar notas de DRUMS e KEYFRAMES para tracks TRIGGER temporárias
-                copy_notes_only(midi, "PART KEYS", "TRIGGER KEYFRAMES", note_map=
-                {96:48, 97:49, 98:50, 99:52})
-                copy_notes_only(midi, "PART DRUMS", "TRIGGER DRUMS", note_map={96:24, 97:25, 98:26, 100:26})
-                # Mesclar os TRIGGER temporários
-                merge_tracks(midi, "TRIGGER KEYFRAMES", "TRIGGER DRUMS", merged_name="TRIGGERS")
-                # Deletar os TRIGGER temporários
-                delete_track(midi, "TRIGGER KEYFRAMES")
-                delete_track(midi, "TRIGGER DRUMS")
-                # Deletar PART DRUMS
-                delete_track(midi, "PART DRUMS")
-                # Deletar PART KEYS
-                delete_track(midi, "PART KEYS")
-            if (click == '2'): # Sem drums no practice
-                # Copiar notas de PART KEYS para TRIGGERS
-                copy_notes_only(midi, "PART KEYS", "TRIGGERS", note_map={96:48, 97:49, 98:50, 99:52})
-                # Deletar PART DRUMS
-                delete_track(midi, "PART DRUMS")
-                # Deletar PART KEYS
-                delete_track(midi, "PART KEYS")
-
-####################################################################################################################################################
-
-            # Remoção de tracks por escolha
-            if (instrument == '1'):
-                delete_track(midi, "PART GUITAR COOP")
-                delete_track(midi, "PART RHYTHM")
-            if (instrument == '2'):
-                delete_track(midi, "PART BASS")
-
-####################################################################################################################################################
-
-            # --------------------------------------------
-            # Finalização
-            # --------------------------------------------
-            # Valida antes de salvar
-            validate_midi_events(midi)
-            # Salvar arquivo processado
-            base, ext = os.path.splitext(input_path)
-            output_path = f"{base}_gh2.mid"
-            midi.save(output_path)
-            print(f"Saved as: {output_path}\n")
-            # Pause de arquivo batch, mas no python (gambiarra)
-
-if (exit == '0'):
-    print("Press Enter to Exit")
-    exit = input()
-
-####################################################################################################################################################
\ No newline at end of file
+        # um manifest por pasta de saída (output_dir ou a raiz de cada entrada)
+        results = run_batch(midi_files, options, jobs=jobs, force=args.force,
+                            cache_dir=cache_dir, profile_dir=args.profile, verbose=args.verbose,
+                            fail_fast=args.fail_fast, variants=variants, output_dir=args.output_dir,
+                            output_zip=args.output_zip, measure_memory=bool(args.report),
+                            manifest_name=None if args.no_manifest else MANIFEST_NAME)
+    if args.report:
+        write_report(args.report, results)
+        print(f"Report saved as: {args.report}")
+
+    # Pause de arquivo batch, mas no python (gambiarra)
+    if interactive or exit == '0':
+        print("Press Enter to Exit")
+        input()
+    if args.fail_fast:
+        return 1 if any(has_failed(r) for r in results) else 0
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+####################################################################################################################################################
@@ -1,5 +1,5 @@
 @echo off
 
-python "msTOgh2.py"
+python "msTOgh2.py" --interactive
 
 pause
\ No newline at end of file
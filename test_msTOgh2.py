@@ -0,0 +1,495 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+import benchmark
+import msTOgh2
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Testes do msTOgh2 (python -m pytest)
+# --------------------------------------------
+# O caminho rápido (bytes crus), o mido e o engine numpy têm que gravar exatamente os mesmos bytes.
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# SMFs montados à mão
+# --------------------------------------------
+
+def varlen(value):
+    out = [value & 0x7f]
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7f) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+def meta(delta, meta_type, data):
+    return varlen(delta) + bytes((0xff, meta_type)) + varlen(len(data)) + data
+
+def text(delta, event):
+    return meta(delta, 0x01, event.encode("latin1"))
+
+def name(track_name, delta=0):
+    return meta(delta, 0x03, track_name.encode("latin1"))
+
+END = meta(0, 0x2f, b"")
+
+def note(delta, status, number, velocity):
+    return varlen(delta) + bytes((status, number, velocity))
+
+def note_pairs(numbers, step=120, length=60):
+    # uma nota depois da outra, note_off com 0x80
+    return b"".join(note(step, 0x90, n, 100) + note(length, 0x80, n, 64) for n in numbers)
+
+def smf(tracks, division=480):
+    out = b"MThd" + (6).to_bytes(4, "big") + (1).to_bytes(2, "big") + len(tracks).to_bytes(2, "big")
+    out += division.to_bytes(2, "big")
+    for chunk in tracks:
+        out += b"MTrk" + len(chunk).to_bytes(4, "big") + chunk
+    return out
+
+KEYS = name("PART KEYS") + text(0, "[idle]") + note_pairs([96, 100, 98, 99, 100]) + END
+
+def hand_chart(guitar, division=480, tempo_extra=b"", events_extra=b"", keys=KEYS):
+    # export RB2 pequeno: tempo, PART GUITAR (dado), PART BASS, PART DRUMS, PART KEYS e EVENTS
+    tempo = (name("tempo") + meta(0, 0x51, (500000).to_bytes(3, "big")) + meta(0, 0x58, bytes((4, 2, 24, 8)))
+             + tempo_extra + END)
+    bass = name("PART BASS") + text(0, "[play]") + note_pairs([96, 97, 98, 116, 100]) + END
+    drums = name("PART DRUMS") + note_pairs([96, 100, 97, 98]) + END
+    events = name("EVENTS") + text(0, "[music_start]") + events_extra + text(960, "[end]") + END
+    return smf([tempo, guitar, bass, drums, keys, events], division)
+
+# PART GUITAR com running status (note_on com velocity 0 desligando), inclusive logo depois de um meta
+RUNNING_STATUS = (name("PART GUITAR") + text(0, "[play]")
+                  + note(120, 0x90, 96, 100) + bytes((0, 100, 100)) + bytes((60, 96, 0)) + bytes((0, 100, 0))
+                  + text(0, "[idle]") + bytes((60, 97, 100)) + bytes((60, 97, 0)) + END)
+
+NOTE_OFFS = name("PART GUITAR") + text(0, "[play]") + note_pairs([96, 97, 98, 99, 100, 116, 98]) + END
+
+SYSEX = (name("PART GUITAR") + varlen(0) + b"\xf0\x05\x43\x10\x4c\x00\xf7" + note_pairs([96, 98])
+         + varlen(10) + b"\xf0\x03\x7e\x00\x09" + END) # o segundo sysex não termina com F7
+
+# track_name depois de outro evento e track_name repetido
+LATE_NAME = text(0, "[play]") + name("PART GUITAR", 30) + note_pairs([96, 97]) + END
+DUPLICATE_NAME = name("PART GUITAR") + note_pairs([96, 97]) + name("PART GUITAR") + name("OTHER") + END
+
+# notas de duração zero (note_on e note_off no mesmo tick, nas duas ordens) e nota religada no mesmo tick
+# em que a anterior desliga
+ZERO_LENGTH = (name("PART GUITAR") + text(0, "[play]") + note(610, 0x90, 98, 100) + note(0, 0x80, 98, 0)
+               + note(0, 0x90, 96, 100) + note(100, 0x90, 96, 100) + note(0, 0x80, 96, 0) + note(100, 0x80, 96, 0)
+               + note_pairs([97, 98]) + note(50, 0x80, 99, 0) + note(0, 0x90, 99, 100) + END)
+
+CHARTS = {
+    "generated": lambda: benchmark.chart_bytes(benchmark.generate_chart(notes=300, seed=1)),
+    "generated_960": lambda: benchmark.chart_bytes(benchmark.generate_chart(notes=300, ticks_per_beat=960, seed=2)),
+    "generated_no_ghl": lambda: benchmark.chart_bytes(benchmark.generate_chart(notes=200, parts=2, ghl=False, seed=3)),
+    "running_status": lambda: hand_chart(RUNNING_STATUS),
+    "note_offs": lambda: hand_chart(NOTE_OFFS),
+    "sysex": lambda: hand_chart(SYSEX, events_extra=varlen(5) + b"\xf0\x02\x01\xf7"),
+    "late_name": lambda: hand_chart(LATE_NAME),
+    "duplicate_name": lambda: hand_chart(DUPLICATE_NAME),
+    "resolution_192": lambda: hand_chart(NOTE_OFFS, division=192),
+    "zero_length": lambda: hand_chart(ZERO_LENGTH),
+}
+
+# key_signature: o caminho rápido não escreve igual ao mido e a conversão volta para o mido
+FALLBACK_CHARTS = {
+    "key_signature": lambda: hand_chart(NOTE_OFFS, tempo_extra=meta(0, 0x59, bytes((0, 0)))),
+}
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Conversão pelos três caminhos
+# --------------------------------------------
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("corpus")
+    paths = {}
+    for chart, build in {**CHARTS, **FALLBACK_CHARTS}.items():
+        paths[chart] = str(folder / f"{chart}.mid")
+        with open(paths[chart], "wb") as f:
+            f.write(build())
+    return paths
+
+def targets(folder, **options):
+    # todas as variantes de click/instrument/metal de uma vez
+    return [(variant._replace(**options), os.path.join(folder, f"{msTOgh2.variant_name(variant)}.mid"))
+            for variant in msTOgh2.ALL_VARIANTS]
+
+def outputs(targets):
+    files = {}
+    for options, output_path in targets:
+        with open(output_path, "rb") as f:
+            files[os.path.basename(output_path)] = f.read()
+    return files
+
+def convert_fast(input_path, folder):
+    fast = targets(folder)
+    warnings, log, reason = msTOgh2._convert_file_fast(input_path, fast)
+    return warnings, outputs(fast) if reason is None else None, reason
+
+def convert_mido(input_path, folder, engine="python"):
+    mido = targets(folder, engine=engine, fast_path=False)
+    warnings = msTOgh2._convert_targets(input_path, mido)
+    return warnings, outputs(mido)
+
+@pytest.mark.parametrize("chart", sorted(CHARTS))
+def test_fast_path_and_mido_write_the_same_bytes(chart, corpus, tmp_path, capsys):
+    os.makedirs(tmp_path / "fast")
+    os.makedirs(tmp_path / "mido")
+    fast_warnings, fast, reason = convert_fast(corpus[chart], str(tmp_path / "fast"))
+    assert reason is None
+    mido_warnings, mido = convert_mido(corpus[chart], str(tmp_path / "mido"))
+    assert fast == mido
+    assert fast_warnings == mido_warnings
+
+@pytest.mark.parametrize("chart", sorted(CHARTS))
+def test_numpy_engine_writes_the_same_bytes(chart, corpus, tmp_path, capsys):
+    if msTOgh2.np is None:
+        pytest.skip("numpy not installed")
+    os.makedirs(tmp_path / "python")
+    os.makedirs(tmp_path / "numpy")
+    python_warnings, python = convert_mido(corpus[chart], str(tmp_path / "python"))
+    numpy_warnings, numpy = convert_mido(corpus[chart], str(tmp_path / "numpy"), engine="numpy")
+    assert python == numpy
+    assert python_warnings == numpy_warnings
+
+def test_numpy_engine_is_used_with_the_default_options(corpus, tmp_path, monkeypatch, capsys):
+    if msTOgh2.np is None:
+        pytest.skip("numpy not installed")
+    # o caminho rápido não tem engine numpy; com engine="numpy" a conversão vai pelo mido
+    calls = []
+    emit = msTOgh2._emit_track_numpy
+    monkeypatch.setattr(msTOgh2, "_emit_track_numpy", lambda *args: calls.append(args[0]) or emit(*args))
+    output_path = str(tmp_path / "numpy.mid")
+    msTOgh2.convert_file(corpus["generated"], output_path, msTOgh2.ConversionOptions(engine="numpy"))
+    assert "PART GUITAR" in calls
+    msTOgh2.convert_file(corpus["generated"], str(tmp_path / "python.mid"))
+    with open(output_path, "rb") as f1, open(str(tmp_path / "python.mid"), "rb") as f2:
+        assert f1.read() == f2.read()
+
+@pytest.mark.parametrize("chart", sorted(FALLBACK_CHARTS))
+def test_fast_path_falls_back_to_mido(chart, corpus, tmp_path, capsys):
+    os.makedirs(tmp_path / "fast")
+    os.makedirs(tmp_path / "mido")
+    warnings, fast, reason = convert_fast(corpus[chart], str(tmp_path / "fast"))
+    assert reason is not None
+    # pela API pública (fast_path=True) o arquivo sai igual ao do mido
+    fast = targets(str(tmp_path / "fast"))
+    msTOgh2._convert_targets(corpus[chart], fast)
+    mido_warnings, mido = convert_mido(corpus[chart], str(tmp_path / "mido"))
+    assert outputs(fast) == mido
+
+def examples(midi):
+    # as funções do bloco "Exemplos" do convert_shared
+    msTOgh2.delete_track(midi, "PART GUITAR")
+    msTOgh2.rename_track_by_name(midi, "PART DRUMS", "DRUMS")
+    msTOgh2.copy_events_only(midi, "PART KEYS", "KEYS COPY")
+    msTOgh2.copy_notes_only(midi, "PART KEYS", "KEYS COPY", note_map={96: 36, 100: [37, 38]})
+    msTOgh2.merge_tracks(midi, "PART BASS", "DRUMS", merged_name="MERGED")
+    msTOgh2.merge_tracks(midi, "MISSING", merged_name="EMPTY")
+    msTOgh2.build_track(midi, "NEW TRACK", [("PART BASS", {96: 36}, False), ("KEYS COPY", {36: 96}, True)],
+                        replace=["KEYS COPY"])
+    msTOgh2.normalize_midi(midi)
+    buffer = io.BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+def test_example_functions_work_on_the_fast_path(capsys):
+    data = hand_chart(RUNNING_STATUS)
+    raw = msTOgh2.RawMidi(memoryview(data))
+    assert examples(raw) == examples(msTOgh2.MidiFile(file=io.BytesIO(data)))
+    assert [track.names[0] for track in raw.tracks[1:]] == ["PART BASS", "EVENTS", "DRUMS", "PART KEYS", "MERGED",
+                                                            "EMPTY", "NEW TRACK"]
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Ordem das notas no mesmo tick (build_track)
+# --------------------------------------------
+
+def built_notes(engine):
+    # PART GUITAR do ZERO_LENGTH depois do build_track, como [(tick, nota, liga?)]
+    data = hand_chart(ZERO_LENGTH)
+    if engine == "raw":
+        midi = msTOgh2.RawMidi(memoryview(data))
+    else:
+        midi = msTOgh2.MidiFile(file=io.BytesIO(data))
+    track = msTOgh2.build_track(midi, "PART GUITAR", [("PART GUITAR", msTOgh2.instrument_notes, True)],
+                                replace=["PART GUITAR"], engine="numpy" if engine == "numpy" else "python")
+    return msTOgh2.track_notes(track)
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "raw"])
+def test_same_tick_note_order(engine):
+    if engine == "numpy" and msTOgh2.np is None:
+        pytest.skip("numpy not installed")
+    # duração zero fica na ordem da origem (liga e desliga); o note_off que fecha a nota ligada antes vem primeiro
+    assert built_notes(engine)[:6] == [(610, 98, True), (610, 98, False), (610, 96, True),
+                                       (710, 96, False), (710, 96, True), (810, 96, False)]
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Normalização (notas de duração zero)
+# --------------------------------------------
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_normalizer_drops_zero_length_notes_in_any_order(raw):
+    guitar = (name("PART GUITAR") + note(100, 0x90, 96, 100)
+              + note(100, 0x80, 96, 0) + note(0, 0x90, 96, 100) # religada: fica
+              + note(100, 0x80, 96, 0)
+              + note(0, 0x80, 98, 0) + note(0, 0x90, 98, 100) # duração zero com o note_off primeiro
+              + note(10, 0x90, 97, 100) + note(0, 0x80, 97, 0) # duração zero com o note_on primeiro
+              + note(0, 0x80, 99, 0) + note(0, 0x90, 99, 100) + note(50, 0x80, 99, 0) # note_off solto antes de uma nota
+              + END)
+    data = smf([name("tempo") + END, guitar])
+    midi = msTOgh2.RawMidi(memoryview(data)) if raw else msTOgh2.MidiFile(file=io.BytesIO(data))
+    msTOgh2.normalize_midi(midi)
+    assert msTOgh2.track_notes(msTOgh2.get_track_by_name(midi, "PART GUITAR")) == [
+        (100, 96, True), (200, 96, False), (200, 96, True), (300, 96, False),
+        (310, 99, False), (310, 99, True), (360, 99, False)]
+
+def test_saved_tracks_have_no_hanging_or_zero_length_notes(corpus, tmp_path, capsys):
+    for options in msTOgh2.ALL_VARIANTS:
+        output_path = str(tmp_path / f"{msTOgh2.variant_name(options)}.mid")
+        msTOgh2.convert_file(corpus["zero_length"], output_path, options)
+        for track in msTOgh2.MidiFile(output_path).tracks:
+            index = msTOgh2.NoteIndex(msTOgh2.track_notes(track))
+            assert index.unmatched_on == [] and index.unmatched_off == [] and index.overlaps == []
+            assert all(start < end for spans in index.spans.values() for start, end in spans)
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Mapa de tempo
+# --------------------------------------------
+
+# 120 BPM, 240 BPM no compasso 2, 60 BPM no meio dele; 3/4 no meio do compasso 2 e 6/8 no compasso 4
+TEMPO_MAP = msTOgh2.TempoMap(480, [(0, 500000), (1920, 250000), (2880, 1000000)],
+                             [(0, 4, 4), (2400, 3, 4), (3840, 6, 8)])
+
+@pytest.mark.parametrize("tick, seconds", [(0, 0.0), (960, 1.0), (1920, 2.0), (2400, 2.25), (2880, 2.5), (3360, 3.5)])
+def test_tempo_map_seconds(tick, seconds):
+    assert TEMPO_MAP.seconds(tick) == pytest.approx(seconds)
+
+@pytest.mark.parametrize("tick, bar_beat", [
+    (0, (1, 1)), (1920, (2, 1)), (2160, (2, 1.5)),
+    (2400, (3, 1)), (3360, (3, 3)),           # 3/4 no meio de um compasso abre um compasso novo
+    (3840, (4, 1)), (4560, (4, 4)), (5400, (5, 1.5))]) # 6/8 conta em colcheias
+def test_tempo_map_bar_beat(tick, bar_beat):
+    assert TEMPO_MAP.bar_beat(tick) == bar_beat
+
+def test_tempo_map_position():
+    assert TEMPO_MAP.position(3360) == "0:03.500, bar 3 beat 3"
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_division_zero_with_tempo_changes_still_converts(fast_path, tmp_path, capsys):
+    # sem ticks por beat o mapa de tempo não calcula segundos, e os avisos ficam sem posição
+    input_path = str(tmp_path / "chart.mid")
+    with open(input_path, "wb") as f:
+        f.write(hand_chart(RUNNING_STATUS, division=0, tempo_extra=meta(480, 0x51, (250000).to_bytes(3, "big"))))
+    warnings = msTOgh2.convert_file(input_path, str(tmp_path / "chart_gh2.mid"),
+                                    msTOgh2.ConversionOptions(fast_path=fast_path))
+    assert all(d.position is None for d in warnings)
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Checagem das notas (check_notes) no arquivo salvo
+# --------------------------------------------
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_note_warnings_match_the_saved_file(fast_path, tmp_path, capsys):
+    guitar = (name("PART GUITAR") + text(0, "[play]")
+              + note(120, 0x90, 96, 100) + note(0, 0x90, 96, 100) + note(60, 0x80, 96, 0) + note(0, 0x80, 96, 0)
+              + note(60, 0x90, 97, 100) + END) # note_on duplicado (o normalize deixa uma nota) e note_on sem note_off
+    input_path = str(tmp_path / "chart.mid")
+    output_path = str(tmp_path / "chart_gh2.mid")
+    with open(input_path, "wb") as f:
+        f.write(hand_chart(guitar, division=960))
+    warnings = msTOgh2.convert_file(input_path, output_path, msTOgh2.ConversionOptions(fast_path=fast_path))
+    # só a nota que continua ligada no arquivo, no tick dele (reescalado de 960 para 480)
+    assert [(d.tick, d.event, d.severity) for d in warnings
+            if d.track == "PART GUITAR" and d.event.startswith("note")] == [(120, "note 97", "critical")]
+    saved = msTOgh2.get_track_by_name(msTOgh2.MidiFile(output_path), "PART GUITAR")
+    index = msTOgh2.NoteIndex(msTOgh2.track_notes(saved))
+    assert index.unmatched_on == [(120, 97)] and index.overlaps == []
+
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_event_and_note_warnings_use_the_ticks_of_the_saved_file(fast_path, tmp_path, capsys):
+    # evento inválido e note_on sem note_off no mesmo lugar de um chart em 960: os dois avisos no tick 4740 (480)
+    guitar = (name("PART GUITAR") + text(0, "[play]") + note(9480, 0x90, 96, 100) + note(0, 0x90, 64, 100)
+              + text(0, "[bogus]") + note(240, 0x80, 96, 0) + END)
+    input_path = str(tmp_path / "chart.mid")
+    with open(input_path, "wb") as f:
+        f.write(hand_chart(guitar, division=960))
+    warnings = msTOgh2.convert_file(input_path, str(tmp_path / "chart_gh2.mid"),
+                                    msTOgh2.ConversionOptions(fast_path=fast_path))
+    found = {d.event: d for d in warnings if d.track == "PART GUITAR"}
+    assert found["[bogus]"].tick == found["note 64"].tick == 4740
+    assert found["[bogus]"].position == found["note 64"].position
+
+####################################################################################################################################################
+
+# --------------------------------------------
+# Relatório (--report)
+# --------------------------------------------
+
+def test_report_has_the_peak_memory_of_each_file(corpus, tmp_path, capsys):
+    results = msTOgh2.run_batch([(corpus[chart], os.path.dirname(corpus[chart])) for chart in ("generated", "sysex")],
+                                output_dir=str(tmp_path / "out"), measure_memory=True)
+    report_path = str(tmp_path / "report.json")
+    msTOgh2.write_report(report_path, results)
+    with open(report_path, encoding="utf-8") as f:
+        report = json.load(f)
+    # o pico é de cada arquivo; a memória máxima do processo aparece uma vez só
+    assert [entry["peak_memory"] > 0 for entry in report["files"]] == [True, True]
+    assert all("max_rss" not in entry for entry in report["files"]) and "max_rss" in report
+
+# --------------------------------------------
+# --fail-fast com --jobs
+# --------------------------------------------
+
+def test_fail_fast_with_jobs_reports_every_file_it_wrote(corpus, tmp_path, capsys):
+    folder = tmp_path / "in"
+    folder.mkdir()
+    (folder / "0_broken.mid").write_bytes(b"not a midi file")
+    for i in range(1, 5):
+        (folder / f"{i}_chart.mid").write_bytes(hand_chart(RUNNING_STATUS))
+    output_dir = tmp_path / "out"
+    results = msTOgh2.run_batch([(str(path), str(folder)) for path in sorted(folder.iterdir())], jobs=2,
+                                fail_fast=True, output_dir=str(output_dir))
+    out = capsys.readouterr().out
+    stopped = int(out.split("Stopped early (--fail-fast): ")[1].split()[0]) if "Stopped early" in out else 0
+    # os que já estavam rodando quando o batch parou entram nos resultados; só os cancelados contam como não convertidos
+    assert len(results) + stopped == 5
+    written = sorted(path.name for path in output_dir.rglob("*.mid")) if output_dir.exists() else []
+    assert written == sorted(os.path.basename(r["output"]) for r in results if r["ok"])
+
+# --------------------------------------------
+# Eventos válidos mudados em runtime
+# --------------------------------------------
+
+def test_reload_valid_events():
+    validator = msTOgh2.EventValidator("PART GUITAR")
+    validator(0, "[my_event]")
+    msTOgh2.valid_events.append("[my_event]")
+    try:
+        msTOgh2.reload_valid_events()
+        validator(480, "[my_event]")
+    finally:
+        msTOgh2.valid_events.remove("[my_event]")
+        msTOgh2.reload_valid_events()
+    validator(960, "[my_event]")
+    assert [d.tick for d in validator.diagnostics] == [0, 960]
+
+# --------------------------------------------
+# Zips de entrada
+# --------------------------------------------
+
+def test_zips_are_closed_when_evicted_and_after_the_batch(tmp_path, capsys):
+    zips = []
+    for i in range(msTOgh2.ZIP_CACHE_SIZE + 2):
+        zips.append(str(tmp_path / f"pack{i}.zip"))
+        with zipfile.ZipFile(zips[-1], "w") as archive:
+            archive.writestr("song.mid", hand_chart(RUNNING_STATUS))
+    opened = []
+    for zip_path in zips:
+        with msTOgh2.open_zip(zip_path) as archive:
+            opened.append(archive)
+    # ZipFile.fp é None depois do close
+    assert [archive.fp is None for archive in opened] == [True, True] + [False] * msTOgh2.ZIP_CACHE_SIZE
+    os.utime(zips[-1], (0, 0)) # zip mudou no disco: o ZipFile antigo é fechado e o zip reaberto
+    with msTOgh2.open_zip(zips[-1]) as archive:
+        assert archive is not opened[-1] and opened[-1].fp is None
+    results = msTOgh2.run_batch(msTOgh2.expand_inputs(zips), output_dir=str(tmp_path / "out"))
+    assert all(r["ok"] for r in results) and len(results) == len(zips)
+    assert not msTOgh2._open_zips and archive.fp is None
+
+# --------------------------------------------
+# Cache de tracks
+# --------------------------------------------
+
+def test_track_cache_keeps_the_entries_used_last(corpus, tmp_path, capsys):
+    cache_dir = str(tmp_path / "cache")
+    msTOgh2.convert_file(corpus["generated"], str(tmp_path / "a_gh2.mid"), cache_dir=cache_dir)
+    first = set(os.listdir(cache_dir))
+    for i, name in enumerate(first):
+        os.utime(os.path.join(cache_dir, name), (i, i)) # usadas há muito tempo
+    msTOgh2.convert_file(corpus["sysex"], str(tmp_path / "b_gh2.mid"), cache_dir=cache_dir)
+    second = set(os.listdir(cache_dir)) - first
+    size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in second)
+    assert msTOgh2.prune_track_cache(cache_dir, size) == len(first)
+    assert set(os.listdir(cache_dir)) == second
+
+def cache_misses(input_path, output_path, cache_dir, options):
+    # saídas que não vieram do cache (nas métricas, o acerto tem cached=True); a saída tem que ser a mesma sem cache
+    result = msTOgh2.process_file(input_path, options, output_path, cache_dir)
+    assert result["ok"]
+    hits = {s["stage"].split(" ", 1)[1] for s in result["metrics"]["stages"] if s.get("cached")}
+    with open(output_path, "rb") as f:
+        cached = f.read()
+    uncached_path = output_path + ".uncached.mid"
+    msTOgh2.convert_file(input_path, uncached_path, options)
+    with open(uncached_path, "rb") as f:
+        assert cached == f.read()
+    return CACHED_OUTPUTS - hits
+
+CACHED_OUTPUTS = {"PART GUITAR", "PART BASS", "PART GUITAR COOP", "PART RHYTHM", "BAND BASS", "BAND DRUMS", "EVENTS",
+                  "BAND SINGER", "TRIGGERS"}
+
+@pytest.mark.parametrize("guitar, keys, rebuilt", [
+    (NOTE_OFFS, KEYS, {"PART GUITAR"}),
+    # lane do BIG-NOTE (100) do PART KEYS: entra no PART GUITAR
+    (RUNNING_STATUS, name("PART KEYS") + text(0, "[idle]") + note_pairs([96, 100, 98, 99]) + END,
+     {"PART GUITAR", "BAND SINGER", "TRIGGERS"}),
+    # keyframes do PART KEYS (evento e nota de trigger): o PART GUITAR não depende deles
+    (RUNNING_STATUS, name("PART KEYS") + text(0, "[play]") + note_pairs([96, 100, 98, 99, 100]) + END,
+     {"BAND SINGER", "TRIGGERS"}),
+    (RUNNING_STATUS, name("PART KEYS") + text(0, "[idle]") + note_pairs([97, 100, 98, 99, 100]) + END,
+     {"BAND SINGER", "TRIGGERS"}),
+], ids=["guitar", "keys big note", "keys event", "keys trigger"])
+@pytest.mark.parametrize("fast_path", [True, False])
+def test_track_cache_rebuilds_only_what_changed(guitar, keys, rebuilt, fast_path, tmp_path, capsys):
+    options = msTOgh2.ConversionOptions(fast_path=fast_path)
+    cache_dir = str(tmp_path / "cache")
+    input_path = str(tmp_path / "chart.mid")
+    with open(input_path, "wb") as f:
+        f.write(hand_chart(RUNNING_STATUS))
+    assert cache_misses(input_path, str(tmp_path / "first_gh2.mid"), cache_dir, options) == CACHED_OUTPUTS
+    assert cache_misses(input_path, str(tmp_path / "same_gh2.mid"), cache_dir, options) == set()
+    with open(input_path, "wb") as f:
+        f.write(hand_chart(guitar, keys=keys))
+    assert cache_misses(input_path, str(tmp_path / "edited_gh2.mid"), cache_dir, options) == rebuilt
+
+# --------------------------------------------
+# Manifest
+# --------------------------------------------
+
+@pytest.mark.parametrize("output_dir", [False, True])
+def test_manifest_lives_next_to_the_outputs(output_dir, tmp_path, monkeypatch, capsys):
+    songs = tmp_path / "songs"
+    (songs / "album").mkdir(parents=True)
+    (songs / "album" / "chart.mid").write_bytes(hand_chart(RUNNING_STATUS))
+    elsewhere = tmp_path / "elsewhere"
+    elsewhere.mkdir()
+    argv = [str(songs)] + (["--output-dir", str(tmp_path / "out")] if output_dir else [])
+    folder = tmp_path / "out" if output_dir else songs
+    monkeypatch.chdir(tmp_path)
+    assert msTOgh2.main(argv) == 0
+    assert "1 converted, 0 unchanged" in capsys.readouterr().out
+    assert (folder / msTOgh2.MANIFEST_NAME).exists() and (folder / msTOgh2.TRACK_CACHE_DIR).is_dir()
+    assert not (tmp_path / msTOgh2.MANIFEST_NAME).exists()
+    # rodando de outra pasta, o mesmo manifest é achado e nada é reconvertido
+    monkeypatch.chdir(elsewhere)
+    assert msTOgh2.main(argv) == 0
+    assert "0 converted, 1 unchanged" in capsys.readouterr().out
+    assert os.listdir(elsewhere) == []